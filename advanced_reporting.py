@@ -1,17 +1,77 @@
-import io
+import logging
+import multiprocessing
+import os
 import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from contextlib import contextmanager
+from functools import cached_property
+from itertools import batched, chain
 from pathlib import Path
 from typing import override
 
-from jinja2 import Environment, FileSystemLoader
-from md2pdf.core import md2pdf
-from tabulate import tabulate
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.orm import object_session
 
 from empire.server.core.db import models
+from empire.server.core.db.base import SessionLocal
 from empire.server.core.db.models import PluginTaskStatus
+from empire.server.core.hooks import hooks
 from empire.server.core.plugins import BasePlugin
 
-from .mitre import Attack
+from .exports import (
+    LAYER_FORMAT,
+    TABLE_FORMATS,
+    navigator_layer,
+    write_csv,
+    write_html,
+    write_jsonl,
+    write_layer,
+)
+from .incremental import ReportState, fingerprint
+from .instrumentation import Instrumentation, RowCounter, row_count
+from .mitre import (
+    DEFAULT_VERSION,
+    Attack,
+    available_versions,
+    check_version,
+    split_technique_id,
+)
+from .pdf_backend import render_pdf, warm_backend, worker_initializer
+from .provisioning import DATASET_URL, expected_sha256, provision
+from .render_cache import ArtifactStore, PdfCache
+from .scheduler import ReportScheduler
+from .tables import HtmlTable, html_rows, html_table
+
+log = logging.getLogger(__name__)
+
+# Background report jobs that may run at once; identical requests coalesce.
+JOB_THREADS = 2
+
+# PDF workers start from a fresh interpreter rather than a fork of the
+# threaded server, which could hand them a lock fontconfig or pango held at
+# the time. pdf_backend.worker_initializer makes render_pdf loadable there.
+PDF_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Converted PDFs kept for byte-identical reports, evicted least recently used.
+PDF_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Finished reports kept to dedupe downloads; overridable by plugin settings.
+ARTIFACT_MAX_MB = 2048
+ARTIFACT_MAX_AGE_DAYS = 30
+
+# Failed ATT&CK provisioning is retried, doubling the wait up to the cap.
+PROVISION_RETRY_SECONDS = 30
+PROVISION_RETRY_MAX_SECONDS = 60 * 60
+
+# Scheduled regeneration, when enabled by the plugin settings.
+SCHEDULE_HOOK_NAME = "report_generation_schedule"
+SCHEDULE_DEBOUNCE_SECONDS = 60
+SCHEDULE_CONCURRENCY = 1
 
 
 class Plugin(BasePlugin):
@@ -33,12 +93,84 @@ class Plugin(BasePlugin):
                 "Strict": True,
             },
             "format": {
-                "Description": "Format of the generated report.",
+                "Description": "Format of the generated report. html is the "
+                "pdf layout without the PDF conversion; csv and jsonl export the "
+                "session, credential and master log rows; navigator writes an "
+                "ATT&CK Navigator layer for the module and empire reports.",
                 "Required": True,
                 "Value": "pdf",
-                "SuggestedValues": ["md", "pdf"],
+                "SuggestedValues": ["md", "pdf", "html", *TABLE_FORMATS, LAYER_FORMAT],
+                "Strict": True,
+            },
+            "incremental": {
+                "Description": "Only render rows added since the last run, "
+                "reusing the cached rest of the session, credential, master "
+                "and module reports.",
+                "Required": False,
+                "Value": "False",
+                "SuggestedValues": ["True", "False"],
+                "Strict": True,
+            },
+            "grouped": {
+                "Description": "Collapse the session and credential reports to one "
+                "row per host and user, and per distinct credential with its "
+                "host count, deduplicated by the database. Always a full "
+                "render, whatever incremental says.",
+                "Required": False,
+                "Value": "False",
+                "SuggestedValues": ["True", "False"],
+                "Strict": True,
+            },
+            "background": {
+                "Description": "Return immediately and generate the reports on a "
+                "background worker, updating the task as each one completes.",
+                "Required": False,
+                "Value": "False",
+                "SuggestedValues": ["True", "False"],
+                "Strict": True,
+            },
+            "instrument": {
+                "Description": "Report per-stage timings, row counts, output "
+                "sizes and tracemalloc peaks for each report in the task output.",
+                "Required": False,
+                "Value": "False",
+                "SuggestedValues": ["True", "False"],
                 "Strict": True,
             },
+            "profile": {
+                "Description": "Attach a cProfile dump of the run as an extra "
+                "download.",
+                "Required": False,
+                "Value": "False",
+                "SuggestedValues": ["True", "False"],
+                "Strict": True,
+            },
+            "chunk_size": {
+                "Description": "Convert the session and credential tables to PDF "
+                "this many rows at a time and merge the parts, bounding "
+                "WeasyPrint's memory by the chunk. 0 converts in one piece.",
+                "Required": False,
+                "Value": "0",
+                "SuggestedValues": ["0", "1000", "5000", "10000"],
+                "Strict": False,
+            },
+            "workers": {
+                "Description": "Processes converting PDFs concurrently. 0 uses "
+                "every available core, 1 converts each report in-line.",
+                "Required": False,
+                "Value": "1",
+                "SuggestedValues": ["0", "1", "2", "4", "8"],
+                "Strict": False,
+            },
+            "version": {
+                "Description": "ATT&CK release the empire and module reports are "
+                "built against. It must be one of the plugin's attack_versions.",
+                "Required": False,
+                "Value": DEFAULT_VERSION,
+                "SuggestedValues": available_versions(self.main_menu)
+                or [DEFAULT_VERSION],
+                "Strict": False,
+            },
             # 'Logo': {
             #     'Description': 'Format of the generated report.',
             #     "Required": False,
@@ -50,88 +182,734 @@ class Plugin(BasePlugin):
         }
 
         self.plugin_dir = Path(__file__).parent
-        self.logo = str(self.plugin_dir / "templates" / "empire.png")
+        self.templates_dir = self.plugin_dir / "templates"
+        self.logo = str(self.templates_dir / "empire.png")
+        self.stylesheet = str(self.templates_dir / "style.css")
+        self.data_dir = self.main_menu.install_path / "data" / "report-generation"
+
         self.Attack = Attack
+        self.pdf_cache = PdfCache(self.data_dir / "pdf-cache", PDF_CACHE_MAX_BYTES)
+        self.artifacts = ArtifactStore(
+            self.data_dir / "artifacts",
+            ARTIFACT_MAX_MB * 1024 * 1024,
+            ARTIFACT_MAX_AGE_DAYS * 24 * 60 * 60,
+        )
+        # Reports render next to the caches, so moving them into the artifact
+        # store and fetching cached PDFs are links rather than copies.
+        self.tmp_dir = self.data_dir / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        self._pdf_pool = None
+        self._pdf_pool_workers = 0
+        # Runs using each pool, so a replaced one outlives its last run.
+        self._pdf_pool_users = {}
+        self._pdf_pool_lock = threading.Lock()
+
+        self._job_executor = ThreadPoolExecutor(
+            max_workers=JOB_THREADS, thread_name_prefix="report-job"
+        )
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        # One per report name; see generate_and_upload_reports.
+        self._report_locks = {}
+        self._report_locks_lock = threading.Lock()
+        self.scheduler = None
+        self._provisioning = None
+        # Settings can change while the plugin is stopped; the scheduler only
+        # runs between on_start and on_stop.
+        self._started = False
+
+        self.settings_options = {
+            "prewarm": {
+                "Description": "After startup, import the PDF toolchain and load "
+                "the ATT&CK index in the background so the first report "
+                "doesn't pay for them.",
+                "Required": False,
+                "Value": "False",
+                "SuggestedValues": ["True", "False"],
+                "Strict": True,
+            },
+            "artifact_max_mb": {
+                "Description": "Disk the store of finished reports may use "
+                "before the least recently used are dropped from it.",
+                "Required": False,
+                "Value": str(ARTIFACT_MAX_MB),
+                "Strict": False,
+            },
+            "artifact_max_age_days": {
+                "Description": "Days a finished report stays in the store, "
+                "available for identical reports to reuse its download.",
+                "Required": False,
+                "Value": str(ARTIFACT_MAX_AGE_DAYS),
+                "Strict": False,
+            },
+            "attack_versions": {
+                "Description": "Comma-separated ATT&CK releases to install at "
+                "startup, each kept side by side under data/.",
+                "Required": False,
+                "Value": DEFAULT_VERSION,
+                "Strict": False,
+            },
+            "attack_source": {
+                "Description": "Local cti tarball or directory to install the "
+                "ATT&CK dataset from at startup; {version} in the path is "
+                "replaced by each of attack_versions. Empty downloads it "
+                "instead, if attack_download allows.",
+                "Required": False,
+                "Value": "",
+                "Strict": False,
+            },
+            "attack_sha256": {
+                "Description": "SHA-256 the ATT&CK tarball must match, whether "
+                "local or downloaded, or comma-separated version=sha256 pairs "
+                "for several versions. Empty skips the check.",
+                "Required": False,
+                "Value": "",
+                "Strict": False,
+            },
+            "attack_download": {
+                "Description": "Download the ATT&CK dataset at startup when no "
+                "attack_source is set, resuming an interrupted download.",
+                "Required": False,
+                "Value": "True",
+                "SuggestedValues": ["True", "False"],
+                "Strict": True,
+            },
+            "schedule": {
+                "Description": "Regenerate reports in the background as agents "
+                "check in, tasks return results and credentials are added, so "
+                "fresh ones are always on the plugin's tasks.",
+                "Required": False,
+                "Value": "False",
+                "SuggestedValues": ["True", "False"],
+                "Strict": True,
+            },
+            "schedule_debounce": {
+                "Description": "Seconds to collect events for before "
+                "regenerating the reports they affect, each once.",
+                "Required": False,
+                "Value": str(SCHEDULE_DEBOUNCE_SECONDS),
+                "Strict": False,
+            },
+            "schedule_concurrency": {
+                "Description": "Scheduled reports that may regenerate at once.",
+                "Required": False,
+                "Value": str(SCHEDULE_CONCURRENCY),
+                "Strict": False,
+            },
+            "schedule_format": {
+                "Description": "Format of scheduled reports.",
+                "Required": False,
+                "Value": "pdf",
+                "SuggestedValues": ["md", "pdf", "html", *TABLE_FORMATS, LAYER_FORMAT],
+                "Strict": True,
+            },
+        }
+
+    @override
+    def on_start(self, db):
+        self._started = True
+        self.apply_settings(self.current_settings(db))
+
+    @override
+    def on_settings_change(self, db, settings):
+        # New settings take effect now rather than at the next server start.
+        self.apply_settings(settings)
+
+    def apply_settings(self, settings):
+        self.artifacts.max_bytes = (
+            int(settings.get("artifact_max_mb") or ARTIFACT_MAX_MB) * 1024 * 1024
+        )
+        self.artifacts.max_age = (
+            float(settings.get("artifact_max_age_days") or ARTIFACT_MAX_AGE_DAYS)
+            * 24
+            * 60
+            * 60
+        )
+        self.start_provisioning(settings)
+        if self._started and option_enabled(settings.get("schedule")):
+            self.start_scheduler(settings)
+        else:
+            self.stop_scheduler()
+
+    def start_provisioning(self, settings):
+        self.stop_provisioning()
+        stop = self._provisioning = threading.Event()
+        threading.Thread(
+            target=self.startup,
+            args=(settings, stop),
+            name="report-startup",
+            daemon=True,
+        ).start()
+
+    def stop_provisioning(self):
+        if self._provisioning is not None:
+            self._provisioning.set()
+            self._provisioning = None
+
+    def startup(self, settings, stop):
+        versions = [
+            v.strip()
+            for v in (settings.get("attack_versions") or DEFAULT_VERSION).split(",")
+            if v.strip()
+        ]
+        pending = [v for v in versions if not self.provision_attack(settings, v)]
+        if option_enabled(settings.get("prewarm")):
+            self.prewarm(versions)
+
+        # Retried until each version is installed, or new settings or a stop
+        # replace this thread; a download resumes where the last one stopped.
+        delay = PROVISION_RETRY_SECONDS
+        while pending and not stop.wait(delay):
+            done = [v for v in pending if self.provision_attack(settings, v)]
+            pending = [v for v in pending if v not in done]
+            if done and option_enabled(settings.get("prewarm")):
+                self.prewarm(done)
+            delay = min(delay * 2, PROVISION_RETRY_MAX_SECONDS)
+
+    def provision_attack(self, settings, version=DEFAULT_VERSION):
+        try:
+            data_dir, attack_dir, complete_marker = self.Attack.dataset_paths(
+                self.main_menu, version
+            )
+            # Installed already, so there's nothing to verify.
+            if complete_marker.is_file():
+                return True
+            sha256 = expected_sha256(settings.get("attack_sha256") or "", version)
+            provision(
+                data_dir,
+                attack_dir,
+                complete_marker,
+                source=(settings.get("attack_source") or "").replace(
+                    "{version}", version
+                ),
+                sha256=sha256,
+                url=DATASET_URL.format(version=version)
+                if option_enabled(settings.get("attack_download"))
+                else None,
+            )
+        except Exception:
+            # Reports that need ATT&CK fail with DatasetNotProvisioned until a
+            # retry succeeds.
+            log.exception(f"ATT&CK v{version} dataset provisioning failed")
+            return False
+        return True
+
+    def prewarm(self, versions=(DEFAULT_VERSION,)):
+        # WeasyPrint and jinja2 are imported on first use rather than
+        # with the plugin, which every server boot would otherwise pay for.
+        try:
+            warm_backend(self.stylesheet, self.logo)
+            self.jinja_env  # noqa: B018
+            # Attack raises until provisioning has installed the dataset.
+            for version in versions:
+                if self.Attack.dataset_ready(self.main_menu, version):
+                    self.Attack(self.main_menu, version)
+        except Exception:
+            log.exception("Report plugin pre-warm failed")
+
+    def start_scheduler(self, settings):
+        # Re-enabling the plugin or changing its settings starts it again;
+        # never leave two running.
+        self.stop_scheduler()
+        self.schedule_format = settings.get("schedule_format") or "pdf"
+        self.scheduler = ReportScheduler(
+            self.submit_scheduled_job,
+            float(settings.get("schedule_debounce") or SCHEDULE_DEBOUNCE_SECONDS),
+            int(settings.get("schedule_concurrency") or SCHEDULE_CONCURRENCY),
+        )
+        hooks.register_hook(
+            hooks.AFTER_AGENT_CHECKIN_HOOK, SCHEDULE_HOOK_NAME, self.on_agent_checkin
+        )
+        hooks.register_hook(
+            hooks.AFTER_TASKING_RESULT_HOOK,
+            SCHEDULE_HOOK_NAME,
+            self.on_tasking_result,
+        )
+        # Empire has no hook for new credentials, and they come from results,
+        # the API and other plugins alike, so catch the inserts themselves.
+        event.listen(models.Credential, "after_insert", self.on_credential_added)
+
+    def stop_scheduler(self):
+        if self.scheduler is None:
+            return
+        hooks.unregister_hook(SCHEDULE_HOOK_NAME)
+        event.remove(models.Credential, "after_insert", self.on_credential_added)
+        self.scheduler.stop()
+        self.scheduler = None
+
+    # The hooks run inside the server's transactions, so they only mark
+    # reports; the regeneration reads them later from its own session.
+    def on_agent_checkin(self, db, agent):
+        self.mark_dirty(db, "session")
+
+    def on_tasking_result(self, db, tasking):
+        self.mark_dirty(db, "master", "module")
+
+    def on_credential_added(self, mapper, connection, credential):
+        self.mark_dirty(object_session(credential), "credential")
+
+    def mark_dirty(self, db, *reports):
+        # Marked once the event's transaction commits; a refresh started
+        # before then can't see what triggered it, e.g. a task's output.
+        if db is not None and db.in_transaction():
+            event.listen(
+                db,
+                "after_commit",
+                lambda _session: self.mark_dirty(None, *reports),
+                once=True,
+            )
+            return
+        # A hook already running on another thread can outlive stop_scheduler.
+        scheduler = self.scheduler
+        if scheduler is not None:
+            scheduler.mark(*reports)
+
+    def submit_scheduled_job(self, report):
+        # Incremental, so a refresh renders only what the events added.
+        command = {
+            "report": report,
+            "format": self.schedule_format,
+            "incremental": "True",
+        }
+        input = f"Scheduled refresh of {report} report"
+        with SessionLocal.begin() as db:
+            plugin_task = models.PluginTask(
+                plugin_id=self.info.id,
+                input=input,
+                input_full=input,
+                user_id=None,
+                status=PluginTaskStatus.queued,
+                output="",
+            )
+            db.add(plugin_task)
+            db.flush()
+            task_id = plugin_task.id
+        return self.submit_job(task_id, None, command)
+
+    @cached_property
+    def jinja_env(self):
+        """
+        One environment for the plugin's lifetime, so templates compile once
+        per process, and their bytecode is reused across server restarts.
+        auto_reload still picks up operator edits to templates/ by mtime.
+        """
+        from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+        jinja_cache = self.data_dir / "jinja-cache"
+        jinja_cache.mkdir(parents=True, exist_ok=True)
+        return Environment(
+            loader=FileSystemLoader(str(self.templates_dir)),
+            bytecode_cache=FileSystemBytecodeCache(str(jinja_cache)),
+            auto_reload=True,
+        )
+
+    @override
+    def on_stop(self, db):
+        self._started = False
+        self.stop_provisioning()
+        self.stop_scheduler()
+
+    @override
+    def on_unload(self, db):
+        self.stop_provisioning()
+        self.stop_scheduler()
+        self._job_executor.shutdown(wait=False, cancel_futures=True)
+        with self._pdf_pool_lock:
+            if self._pdf_pool is not None:
+                self._pdf_pool.shutdown(cancel_futures=True)
+                self._pdf_pool = None
 
     def execute(self, command, **kwargs):
         user = kwargs["user"]
         db = kwargs["db"]
+        check_command(command)
         input = f"Generating reports for: {command['report']}"
+        background = option_enabled(command.get("background"))
         plugin_task = models.PluginTask(
             plugin_id=self.info.id,
             input=input,
             input_full=input,
             # None on the auto_execute path, where there is no request user.
             user_id=user.id if user else None,
-            status=PluginTaskStatus.completed,
+            status=PluginTaskStatus.queued
+            if background
+            else PluginTaskStatus.completed,
         )
-        output = ""
-        db_downloads = []
 
         # if self.options["Logo"] == "":
         #     self.logo = self.install_path + '/plugins/Report-Generation-Plugin/templates/empire.png'
         # else:
         #     print('test')
 
-        report = command["report"]
-        fmt = command["format"]
-        if report in ["session", "all"]:
-            db_download = self.session_report(db, user, fmt)
-            db_downloads.append(db_download)
-            output += f"[*] Session report generated to {db_download.location}\n"
-        if report in ["empire", "all"]:
-            db_download = self.empire_report(db, user, fmt)
-            db_downloads.append(db_download)
-            output += f"[*] Empire report generated to {db_download.location}\n"
-        if report in ["credential", "all"]:
-            db_download = self.credential_report(db, user, fmt)
-            db_downloads.append(db_download)
-            output += f"[*] Credential report generated to {db_download.location}\n"
-        if report in ["master", "all"]:
-            db_download = self.master_log(db, user, fmt)
-            db_downloads.append(db_download)
-            output += f"[*] Master report generated to {db_download.location}\n"
-        if report in ["module", "all"]:
-            db_download = self.module_report(db, user, fmt)
-            db_downloads.append(db_download)
-            output += f"[*] Module report generated to {db_download.location}\n"
+        if background:
+            plugin_task.output = ""
+            db.add(plugin_task)
+            db.flush()
+            # The job opens its own session, so it can only start once this
+            # request's transaction has committed the task it reports into.
+            task_id = plugin_task.id
+            user_id = plugin_task.user_id
+            event.listen(
+                db,
+                "after_commit",
+                lambda _session: self.submit_background_job(task_id, user_id, command),
+                once=True,
+            )
+            return
 
-        output += "[*] Execution complete.\n"
-        plugin_task.output = output
+        output = []
+        db_downloads = self.run_reports(
+            db, user, command, lambda line, _: output.append(line)
+        )
+
+        output.append("[*] Execution complete.\n")
+        plugin_task.output = "".join(output)
         plugin_task.downloads = db_downloads
         db.add(plugin_task)
         db.flush()
 
-    def generate_report(
-        self, md_template: str, temp_var: dict, md_file: str, pdf_out: str, fmt: str
-    ):
+    def run_reports(self, db, user, command, on_report=None):
         """
-        Generate pdf or markdown files using mustache templating
+        Generate the reports selected by command, calling
+        on_report(output_line, db_download) as each one is uploaded.
         """
-        env = Environment(loader=FileSystemLoader(str(self.plugin_dir / "templates")))
-        template = env.get_template(md_template)
-
-        # Save markdown to file, if it requires editing
-        md_out = template.render(temp_var)
-        with open(md_file, "w") as f:
-            f.write(md_out)
-
-        if fmt == "pdf":
-            # Generate PDF from MD file
-            md2pdf(
-                pdf_out,
-                md_content=md_out,
-                css_file_path=str(self.plugin_dir / "templates" / "style.css"),
-                base_url=".",
+        report = command["report"]
+        fmt = command["format"]
+        incremental = option_enabled(command.get("incremental"))
+        grouped = option_enabled(command.get("grouped"))
+        version = check_version(command.get("version") or DEFAULT_VERSION)
+        workers = int(command.get("workers") or 1)
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        chunk_size = int(command.get("chunk_size") or 0)
+
+        # Keyed by the "report" option, in the order reports are generated.
+        builders = {
+            "session": (
+                "Session",
+                "Sessions_Report",
+                lambda: self.session_template_vars(db, incremental, grouped),
+            ),
+            "empire": (
+                "Empire",
+                "Empire_Report",
+                lambda: self.empire_template_vars(db, version),
+            ),
+            "credential": (
+                "Credential",
+                "Credentials_Report",
+                lambda: self.credential_template_vars(db, incremental, grouped),
+            ),
+            "master": (
+                "Master",
+                "Masterlog_Report",
+                lambda: self.master_log_template_vars(db, incremental),
+            ),
+            "module": (
+                "Module",
+                "Module_Report",
+                lambda: self.module_template_vars(db, incremental, version),
+            ),
+        }
+        # The data formats replace the template vars with rows or a layer, and
+        # only exist for some reports.
+        if fmt in TABLE_FORMATS:
+            exports = {
+                "session": lambda: self.session_query(db, grouped=grouped),
+                "credential": lambda: self.credential_query(db, grouped=grouped),
+                "master": lambda: self.master_log_query(db, truncate=False),
+            }
+        elif fmt == LAYER_FORMAT:
+            exports = {
+                "empire": lambda: self.empire_layer(version),
+                "module": lambda: self.module_layer(db, incremental, version),
+            }
+        else:
+            exports = None
+
+        selected = []
+        for key, (label, report_name, template_vars) in builders.items():
+            if report not in [key, "all"]:
+                continue
+            if exports is None:
+                selected.append((label, report_name, template_vars))
+            elif key in exports:
+                selected.append((label, report_name, exports[key]))
+            elif on_report is not None:
+                on_report(f"[*] {label} report has no {fmt} form, skipped.\n", None)
+        labels = {report_name: label for label, report_name, _ in selected}
+        cache_hits = []
+
+        def uploaded(report_name, db_download, cache_hit):
+            cache_hits.append(cache_hit)
+            if on_report is not None:
+                on_report(
+                    f"[*] {labels[report_name]} report generated to "
+                    f"{db_download.location}\n",
+                    db_download,
+                )
+
+        instrumentation = Instrumentation(
+            enabled=option_enabled(command.get("instrument")),
+            profile=option_enabled(command.get("profile")),
+        )
+        with instrumentation:
+            db_downloads = self.generate_and_upload_reports(
+                db,
+                user,
+                [
+                    (report_name, template_vars)
+                    for _, report_name, template_vars in selected
+                ],
+                fmt,
+                workers,
+                uploaded,
+                instrumentation,
+                chunk_size,
             )
-            return pdf_out
-        if fmt == "md":
-            return md_file
-        raise ValueError("Invalid format")
 
-    def empire_report(self, db, user, fmt):
+        if on_report is not None:
+            if fmt == "pdf":
+                hits = cache_hits.count(True)
+                on_report(
+                    f"[*] PDF cache: {hits} hits, {len(cache_hits) - hits} misses\n",
+                    None,
+                )
+            for metrics in instrumentation.reports:
+                on_report(metrics.summary(), None)
+
+        if instrumentation.profiler is not None:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                profile = Path(tmp_dir) / "Report_Profile.prof"
+                instrumentation.dump_profile(profile)
+                db_download = self.main_menu.downloadsv2.create_download(
+                    db, user, profile
+                )
+            db_downloads.append(db_download)
+            if on_report is not None:
+                on_report(
+                    f"[*] Profile written to {db_download.location}\n", db_download
+                )
+        return db_downloads
+
+    def submit_background_job(self, task_id, user_id, command):
+        # Runs after the request's commit: raising would surface from the
+        # caller's commit and leave the task queued forever, so a failure is
+        # recorded on the task instead.
+        try:
+            return self.submit_job(task_id, user_id, command)
+        except Exception as e:
+            log.exception(f"Report task {task_id} could not be started")
+            with SessionLocal.begin() as db:
+                plugin_task = db.get(models.PluginTask, task_id)
+                plugin_task.output = f"[!] Report generation failed to start: {e}\n"
+                plugin_task.status = PluginTaskStatus.error
+            return None
+
+    def submit_job(self, task_id, user_id, command):
+        # Requests that would render identical reports share one job instead
+        # of rendering the same PDFs twice. Instrumentation and tuning options
+        # are part of the key, since a request asking for metrics or a profile
+        # must get its own.
+        key = (
+            command["report"],
+            command["format"],
+            option_enabled(command.get("incremental")),
+            option_enabled(command.get("grouped")),
+            command.get("version") or DEFAULT_VERSION,
+            option_enabled(command.get("instrument")),
+            option_enabled(command.get("profile")),
+            int(command.get("chunk_size") or 0),
+            int(command.get("workers") or 1),
+        )
+        with self._jobs_lock:
+            leader = self._jobs.get(key)
+            if leader is not None and not leader.done():
+                leader.add_done_callback(
+                    lambda job: self.finish_coalesced_job(task_id, job)
+                )
+                return leader
+
+            job = self._job_executor.submit(self.run_job, task_id, user_id, command)
+            job.task_id = task_id
+            self._jobs[key] = job
+            return job
+
+    def run_job(self, task_id, user_id, command):
+        with SessionLocal() as db:
+            plugin_task = db.get(models.PluginTask, task_id)
+            user = db.get(models.User, user_id) if user_id is not None else None
+            plugin_task.status = PluginTaskStatus.started
+            db.commit()
+
+            def progress(line, db_download):
+                # Committed per report, so each download shows up on the task
+                # while the remaining reports are still rendering.
+                plugin_task.output += line
+                if db_download is not None:
+                    plugin_task.downloads.append(db_download)
+                db.commit()
+
+            try:
+                db_downloads = self.run_reports(db, user, command, progress)
+            except Exception as e:
+                log.exception(f"Report task {task_id} failed")
+                db.rollback()
+                plugin_task.output += f"[!] Report generation failed: {e}\n"
+                plugin_task.status = PluginTaskStatus.error
+                db.commit()
+                raise
+
+            plugin_task.output += "[*] Execution complete.\n"
+            plugin_task.status = PluginTaskStatus.completed
+            db.commit()
+            return [d.id for d in db_downloads], plugin_task.output
+
+    def finish_coalesced_job(self, task_id, job):
+        with SessionLocal.begin() as db:
+            plugin_task = db.get(models.PluginTask, task_id)
+            if job.exception() is not None:
+                plugin_task.output = (
+                    f"[!] Report task {job.task_id} this request was coalesced "
+                    f"with failed: {job.exception()}\n"
+                )
+                plugin_task.status = PluginTaskStatus.error
+                return
+
+            download_ids, output = job.result()
+            plugin_task.output = (
+                f"[*] Coalesced with identical report task {job.task_id}.\n{output}"
+            )
+            plugin_task.downloads = [db.get(models.Download, i) for i in download_ids]
+            plugin_task.status = PluginTaskStatus.completed
+
+    def convert_pdf(self, md_file: str, pdf_out: str):
+        # Generate PDF from MD file
+        render_pdf(pdf_out, md_file, self.stylesheet, self.logo)
+
+    def render_markdown(self, md_template: str, temp_var: dict, md_file: str):
+        template = self.jinja_env.get_template(md_template)
+
+        # Save markdown to file, if it requires editing. Streamed, so template
+        # variables that are generators are written out as they're produced.
+        template.stream(temp_var).dump(md_file)
+
+    def render_chunks(self, report_name, temp_var, chunk_size, tmp_dir):
+        """
+        Render the report's table chunk_size rows at a time: the first chunk
+        through the report template, the rest through its chunk template.
+        Returns (markdown file, outline title) pairs.
+        """
+        name, table = next(
+            (k, v) for k, v in temp_var.items() if isinstance(v, HtmlTable)
+        )
+        batches = batched(table.rows, chunk_size)
+        # An empty table still renders the report once.
+        first = next(batches, ())
+        chunks = []
+        start = 0
+        for i, batch in enumerate(chain([first], batches)):
+            chunk = HtmlTable(table.header, batch)
+            md_file = str(tmp_dir / f"{report_name}-{i}.md")
+            if i == 0:
+                self.render_markdown(
+                    f"{report_name.lower()}_template.md",
+                    {**temp_var, name: chunk},
+                    md_file,
+                )
+            else:
+                self.render_markdown(
+                    f"{report_name.lower()}_chunk_template.md",
+                    {**temp_var, "table": chunk},
+                    md_file,
+                )
+            chunks.append((md_file, f"Rows {start + 1}-{start + len(batch)}"))
+            start += len(batch)
+        return chunks
+
+    def convert_chunks(self, md_files, pdf_out, pool=None):
+        """
+        Convert each chunk on its own, in the pool when there is one, and
+        merge the parts with an outline entry per chunk.
+        """
+        from pypdf import PdfWriter
+
+        parts = [md_file[: -len(".md")] + ".pdf" for md_file, _ in md_files]
+        if pool is None:
+            for (md_file, _), part in zip(md_files, parts, strict=True):
+                self.convert_pdf(md_file, part)
+        else:
+            futures = [
+                pool.submit(render_pdf, part, md_file, self.stylesheet, self.logo)
+                for (md_file, _), part in zip(md_files, parts, strict=True)
+            ]
+            for future in futures:
+                future.result()
+
+        writer = PdfWriter()
+        for (_, title), part in zip(md_files, parts, strict=True):
+            writer.append(part, outline_item=title)
+        with open(pdf_out, "wb") as f:
+            writer.write(f)
+        writer.close()
+
+    @contextmanager
+    def pdf_pool(self, workers):
+        """
+        The shared PDF pool for a run, or None when it converts in-process.
+        Kept across runs so worker start-up and WeasyPrint's imports, fonts
+        and stylesheet are paid once per worker. A different worker count
+        replaces it, and the old one shuts down once no run is using it.
+        """
+        if workers <= 1:
+            yield None
+            return
+        with self._pdf_pool_lock:
+            if self._pdf_pool is None or self._pdf_pool_workers != workers:
+                self._retire_pdf_pool()
+                initializer, initargs = worker_initializer(self.stylesheet)
+                self._pdf_pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=PDF_POOL_CONTEXT,
+                    initializer=initializer,
+                    initargs=initargs,
+                )
+                self._pdf_pool_workers = workers
+            pool = self._pdf_pool
+            self._pdf_pool_users[pool] = self._pdf_pool_users.get(pool, 0) + 1
+        try:
+            yield pool
+        finally:
+            with self._pdf_pool_lock:
+                self._pdf_pool_users[pool] -= 1
+                if not self._pdf_pool_users[pool]:
+                    del self._pdf_pool_users[pool]
+                    if pool is not self._pdf_pool:
+                        pool.shutdown(wait=False)
+
+    def _retire_pdf_pool(self, pool=None):
+        # Called with _pdf_pool_lock held. Stops handing out the current pool
+        # (or pool, if it still is current); runs still using it finish first.
+        old = self._pdf_pool
+        if old is None or (pool is not None and pool is not old):
+            return
+        self._pdf_pool = None
+        if old not in self._pdf_pool_users:
+            old.shutdown(wait=False)
+
+    def empire_report(self, db, user, fmt, version=DEFAULT_VERSION):
+        return self.generate_and_upload_report(
+            db,
+            user,
+            lambda: self.empire_template_vars(db, version),
+            "Empire_Report",
+            fmt,
+        )
+
+    def empire_template_vars(self, db, version=DEFAULT_VERSION):
         # Pull techniques and software used with Empire
-        software, techniques = self.Attack(self.main_menu).attack_searcher()
+        software, techniques = self.Attack(self.main_menu, version).attack_searcher()
 
         # Set info from database
         description = software["description"]
@@ -150,143 +928,596 @@ class Plugin(BasePlugin):
         template_vars = {
             "logo": self.logo,
             "description": description,
-            "platforms": tabulate(platforms, tablefmt="html"),
+            "platforms": "".join(html_table(platforms[0], ())),
             "techniques": used_techniques,
+            "row_count": len(techniques),
         }
 
+        return template_vars
+
+    def empire_layer(self, version=DEFAULT_VERSION):
+        software, techniques = self.Attack(self.main_menu, version).attack_searcher()
+        return navigator_layer(
+            "Empire",
+            software["description"],
+            version,
+            [
+                (technique_external_id(technique), 1, "Used by Empire", [])
+                for technique in techniques
+                if technique_external_id(technique)
+            ],
+        )
+
+    def report_state(self, report_name, incremental):
+        template = self.templates_dir / f"{report_name.lower()}_template.md"
+        state_dir = self.data_dir / "incremental" if incremental else None
+        return ReportState(state_dir, report_name, fingerprint(template))
+
+    def session_report(self, db, user, fmt, incremental=False, grouped=False):
         return self.generate_and_upload_report(
-            db, user, template_vars, "Empire_Report", fmt
+            db,
+            user,
+            lambda: self.session_template_vars(db, incremental, grouped),
+            "Sessions_Report",
+            fmt,
         )
 
-    def session_report(self, db, user, fmt):
-        sessions = [
-            (
-                session.session_id,
-                session.hostname,
-                session.username,
-                session.firstseen_time,
-            )
-            for session in db.query(models.Agent).all()
-        ]
-        sessions.insert(0, ("SessionID", "Hostname", "User Name", "First Check-in"))
+    def session_template_vars(self, db, incremental=False, grouped=False):
+        # Every new session can change any group, so grouped reports are
+        # always rendered in full.
+        state = self.report_state("Sessions_Report", incremental and not grouped)
+        query = self.session_query(db, state.watermark, grouped)
+        counter = RowCounter()
+
+        def rows():
+            for row in counter(query.yield_per(1000)):
+                if not grouped:
+                    # Empire fills in the host and user after creating the
+                    # session, so one without them isn't cached yet.
+                    if not (row.hostname and row.username):
+                        state.hold()
+                    if not state.held:
+                        state.watermark = session_watermark(state.watermark, row)
+                yield row
 
+        if grouped:
+            header = ("Hostname", "User Name", "Sessions", "First Check-in")
+        else:
+            header = ("SessionID", "Hostname", "User Name", "First Check-in")
         template_vars = {
             "logo": self.logo,
-            "sessions": tabulate(sessions, tablefmt="html"),
+            "row_count": counter,
+            "sessions": HtmlTable(header, state.fragments(html_rows(rows()))),
         }
 
+        return template_vars
+
+    def session_query(self, db, watermark=None, grouped=False):
+        if grouped:
+            # One row per host and user, deduplicated and sorted by the
+            # database.
+            return (
+                db.query(
+                    models.Agent.hostname,
+                    models.Agent.username,
+                    func.count().label("sessions"),
+                    func.min(models.Agent.firstseen_time).label("firstseen_time"),
+                )
+                .group_by(models.Agent.hostname, models.Agent.username)
+                .order_by(models.Agent.hostname, models.Agent.username)
+            )
+        query = db.query(
+            models.Agent.session_id,
+            models.Agent.hostname,
+            models.Agent.username,
+            models.Agent.firstseen_time,
+        ).order_by(models.Agent.firstseen_time)
+        if watermark is not None:
+            # Check-ins can share a timestamp (whole seconds on MySQL), so the
+            # last cached one is queried again, less the sessions cached at it.
+            seen_time, seen_ids = watermark
+            seen_time = datetime.fromisoformat(seen_time)
+            query = query.filter(
+                or_(
+                    models.Agent.firstseen_time > seen_time,
+                    and_(
+                        models.Agent.firstseen_time == seen_time,
+                        models.Agent.session_id.not_in(seen_ids),
+                    ),
+                )
+            )
+        return query
+
+    def credential_report(self, db, user, fmt, incremental=False, grouped=False):
         return self.generate_and_upload_report(
-            db, user, template_vars, "Sessions_Report", fmt
+            db,
+            user,
+            lambda: self.credential_template_vars(db, incremental, grouped),
+            "Credentials_Report",
+            fmt,
         )
 
-    def credential_report(self, db, user, fmt):
-        creds = [("Domain", "Username", "Host", "Cred Type", "Password")]
-        for row in db.query(models.Credential).all():
-            creds.append(
-                [row.domain, row.username, row.host, row.credtype, row.password]
-            )
+    def credential_template_vars(self, db, incremental=False, grouped=False):
+        # Every new credential can change any group, so grouped reports are
+        # always rendered in full.
+        state = self.report_state("Credentials_Report", incremental and not grouped)
+        # Credentials can be edited or deleted after they're cached.
+        if state.watermark is not None and state.data.get(
+            "stamp"
+        ) != self.credential_stamp(db, state.watermark):
+            state.reset()
+        query = self.credential_query(db, state.watermark, grouped)
+        counter = RowCounter()
 
+        def rows():
+            for row in counter(query.yield_per(1000)):
+                if grouped:
+                    yield row
+                    continue
+                state.watermark = row.id
+                yield row[1:]
+            if state.enabled and state.watermark is not None:
+                state.data["stamp"] = self.credential_stamp(db, state.watermark)
+
+        if grouped:
+            header = ("Domain", "Username", "Cred Type", "Password", "Hosts")
+        else:
+            header = ("Domain", "Username", "Host", "Cred Type", "Password")
         # Add data to Jinja2 Template
-        template_vars = {"logo": self.logo, "creds": tabulate(creds, tablefmt="html")}
+        template_vars = {
+            "logo": self.logo,
+            "row_count": counter,
+            "creds": HtmlTable(header, state.fragments(html_rows(rows()))),
+        }
 
+        return template_vars
+
+    def credential_stamp(self, db, watermark):
+        # Changes with any edit or deletion among the credentials up to
+        # watermark.
+        count, updated_at = (
+            db.query(func.count(), func.max(models.Credential.updated_at))
+            .filter(models.Credential.id <= watermark)
+            .one()
+        )
+        return [count, updated_at.isoformat() if updated_at else None]
+
+    def credential_query(self, db, watermark=None, grouped=False):
+        if grouped:
+            # One row per distinct credential with the number of hosts it was
+            # harvested from, most widespread first.
+            hosts = func.count(models.Credential.host.distinct())
+            group = (
+                models.Credential.domain,
+                models.Credential.username,
+                models.Credential.credtype,
+                models.Credential.password,
+            )
+            return (
+                db.query(*group, hosts.label("hosts"))
+                .group_by(*group)
+                .order_by(hosts.desc(), *group)
+            )
+        # id leads so the table can drop it; exports keep it.
+        query = db.query(
+            models.Credential.id,
+            models.Credential.domain,
+            models.Credential.username,
+            models.Credential.host,
+            models.Credential.credtype,
+            models.Credential.password,
+        ).order_by(models.Credential.id)
+        if watermark is not None:
+            query = query.filter(models.Credential.id > watermark)
+        return query
+
+    def master_log(self, db, user, fmt, incremental=False):
         return self.generate_and_upload_report(
-            db, user, template_vars, "Credentials_Report", fmt
+            db,
+            user,
+            lambda: self.master_log_template_vars(db, incremental),
+            "Masterlog_Report",
+            fmt,
         )
 
-    def master_log(self, db, user, fmt):
-        out = io.StringIO()
-        out.write("=" * 50 + "\n\n")
-        for row in db.query(models.AgentTask).all():
-            row: models.AgentTask
-            username = row.user.username if row.user else "None"
-            out.write(
-                f"\n{xstr(row.created_at)} - {xstr(row.id)} ({xstr(row.agent_id)})> "
-                f"{xstr(username)}\n {xstr(row.input)[:100]}\n {xstr(row.output)[:1000]}\n"
+    def master_log_template_vars(self, db, incremental=False):
+        state = self.report_state("Masterlog_Report", incremental)
+        rows = self.master_log_query(db, state.watermark)
+
+        # Add data to Jinja2 Template. The log is a generator: the template
+        # streams it to disk without holding every task in memory.
+        counter = RowCounter()
+        template_vars = {
+            "logo": self.logo,
+            "row_count": counter,
+            "log": state.fragments(
+                master_log_lines(counter(rows.yield_per(1000)), state)
+            ),
+        }
+
+        return template_vars
+
+    def master_log_query(self, db, watermark=None, truncate=True):
+        # Only the columns the log shows, truncated by the database and with
+        # the username joined in, so no task blob or User row is loaded.
+        task_input = models.AgentTask.input
+        task_output = models.AgentTask.output
+        if truncate:
+            task_input = func.substr(task_input, 1, 100)
+            task_output = func.substr(task_output, 1, 1000)
+        query = (
+            db.query(
+                models.AgentTask.created_at,
+                models.AgentTask.id,
+                models.AgentTask.agent_id,
+                models.User.username,
+                task_input.label("input"),
+                task_output.label("output"),
             )
+            .outerjoin(models.User, models.AgentTask.user_id == models.User.id)
+            .order_by(models.AgentTask.id)
+        )
+        if watermark is not None:
+            query = query.filter(models.AgentTask.id > watermark)
+        return query
 
-        output_str = out.getvalue()
+    def module_report(self, db, user, fmt, incremental=False, version=DEFAULT_VERSION):
+        return self.generate_and_upload_report(
+            db,
+            user,
+            lambda: self.module_template_vars(db, incremental, version),
+            "Module_Report",
+            fmt,
+        )
+
+    def module_template_vars(self, db, incremental=False, version=DEFAULT_VERSION):
+        used_techniques = []
+        for technique, _, module_names in self.module_techniques(
+            db, incremental, version
+        ):
+            used_techniques.append("<h3>" + technique["name"] + "</h3>")
+            # " / " not ", ": the template renders this list through
+            # |replace(",", ""), which strips a comma separator.
+            used_techniques.append(
+                "**Empire Modules Used:** " + " / ".join(module_names) + "<br><br>"
+            )
+            used_techniques.append(technique.get("description", ""))
 
         # Add data to Jinja2 Template
-        template_vars = {"logo": self.logo, "log": output_str}
+        template_vars = {
+            "logo": self.logo,
+            "row_count": len(used_techniques) // 3,
+            "techniques": used_techniques,
+        }
 
-        return self.generate_and_upload_report(
-            db, user, template_vars, "Masterlog_Report", fmt
+        return template_vars
+
+    def module_layer(self, db, incremental=False, version=DEFAULT_VERSION):
+        return navigator_layer(
+            "Empire Modules",
+            "ATT&CK techniques covered by the modules tasked on this server, "
+            "scored by module count.",
+            version,
+            [
+                (external_id, len(module_names), ", ".join(module_names), module_names)
+                for _, external_id, module_names in self.module_techniques(
+                    db, incremental, version
+                )
+            ],
         )
 
-    def module_report(self, db, user, fmt):
+    def module_techniques(self, db, incremental=False, version=DEFAULT_VERSION):
+        """
+        (technique, external id, sorted module names) for every ATT&CK
+        technique a tasked module declares.
+        """
         # TODO: Pull all software for module report
         # software, techniques = self.Attack(self.main_menu).attack_searcher()
 
         # Pull all techniques from MITRE database
-        techniques = self.Attack(self.main_menu).all_attacks()
+        attack = self.Attack(self.main_menu, version)
+        techniques = attack.all_attacks()
 
         # Keyed by technique and deduplicated by module: a module tasked 200
         # times declares its techniques once.
         modules_by_technique: dict[str, set[str]] = {}
-        tasked_module_ids = {
-            module_name
-            for (module_name,) in db.query(models.AgentTask.module_name).distinct()
+        # Only the tasked module ids are cached: the ATT&CK side is re-read
+        # every run, so a dataset change needs no invalidation here.
+        state = self.report_state("Module_Report", incremental)
+        last_task_id = db.query(func.max(models.AgentTask.id)).scalar()
+        query = db.query(models.AgentTask.module_name).filter(
+            models.AgentTask.id <= last_task_id
+        )
+        if state.watermark is not None:
+            query = query.filter(models.AgentTask.id > state.watermark)
+        tasked_module_ids = set(state.data.get("modules", [])) | {
+            module_name for (module_name,) in query.distinct() if module_name
         }
+        state.watermark = last_task_id
+        state.data["modules"] = sorted(tasked_module_ids)
+        state.save()
+
         for module_id in tasked_module_ids:
             module = self.main_menu.modulesv2.modules.get(module_id)
             if module is None:
                 continue
             for technique_id in module.techniques:
-                modules_by_technique.setdefault(technique_id, set()).add(module.name)
+                modules_by_technique.setdefault(
+                    technique_id.strip().upper(), set()
+                ).add(module.name)
 
-        used_techniques = []
+        # Modules declare ids from whichever release they were written
+        # against; ids revoked since count towards their replacements, which
+        # is one lookup per declared id rather than per technique.
+        current_ids = attack.current_technique_ids(modules_by_technique)
+        remapped: dict[str, set[str]] = {}
+        for declared_id, module_names in modules_by_technique.items():
+            remapped.setdefault(
+                current_ids.get(declared_id, declared_id), set()
+            ).update(module_names)
+        modules_by_technique = remapped
+
+        used = []
         for technique in techniques:
-            try:
-                external_id = technique._inner["external_references"][0]._inner[
-                    "external_id"
-                ]
-            except (KeyError, IndexError):
+            external_id = technique_external_id(technique)
+            # Revoked techniques carry no description (129 of 670 in v8.2);
+            # their modules were moved onto the replacement above.
+            if external_id is None or technique.get("revoked", False):
                 continue
 
-            # Substring, not equality: a module declaring T1059 also covers
-            # sub-techniques like T1059.001.
-            module_names = sorted(
-                {
-                    name
-                    for technique_id, names in modules_by_technique.items()
-                    if technique_id in external_id
-                    for name in names
-                }
-            )
-            if not module_names:
-                continue
+            # A module declaring T1059 also covers sub-techniques like
+            # T1059.001; one declaring T1059.001 covers only that one.
+            parent_id, sub_id = split_technique_id(external_id)
+            module_names = modules_by_technique.get(external_id, set())
+            if sub_id is not None:
+                module_names = module_names | modules_by_technique.get(parent_id, set())
+            if module_names:
+                used.append((technique, external_id, sorted(module_names)))
+        return used
 
-            used_techniques.append("<h3>" + technique["name"] + "</h3>")
-            # " / " not ", ": the template renders this list through
-            # |replace(",", ""), which strips a comma separator.
-            used_techniques.append(
-                "**Empire Modules Used:** " + " / ".join(module_names) + "<br><br>"
-            )
-            # Revoked techniques carry no description (129 of 670 in v8.2).
-            used_techniques.append(technique._inner.get("description", ""))
+    def generate_and_upload_report(self, db, user, template_vars, report_name, fmt):
+        return self.generate_and_upload_reports(
+            db, user, [(report_name, template_vars)], fmt
+        )[0]
 
-        # Add data to Jinja2 Template
-        template_vars = {"logo": self.logo, "techniques": used_techniques}
+    def generate_and_upload_reports(
+        self,
+        db,
+        user,
+        reports,
+        fmt,
+        workers=1,
+        on_upload=None,
+        instrumentation=None,
+        chunk_size=0,
+    ):
+        """
+        Generate (report_name, template vars builder) pairs in order. Builders
+        and markdown rendering run here, on the caller's session; with more
+        than one worker the PDF conversions run in a process pool while later
+        reports are still being queried.
+        """
+        if fmt not in ["md", "pdf", "html", *TABLE_FORMATS, LAYER_FORMAT]:
+            raise ValueError("Invalid format")
+        if instrumentation is None:
+            instrumentation = Instrumentation()
+        db_downloads = []
 
-        return self.generate_and_upload_report(
-            db, user, template_vars, "Module_Report", fmt
-        )
+        def upload(metrics, report, cache_hit):
+            # Whichever file the requested format produced, not a fixed .pdf.
+            with metrics.stage("upload"):
+                db_download = self.create_download(db, user, Path(report))
+            metrics.output_bytes = os.path.getsize(report)
+            instrumentation.finish(metrics)
+            db_downloads.append(db_download)
+            if on_upload is not None:
+                on_upload(metrics.report_name, db_download, cache_hit)
 
-    def generate_and_upload_report(self, db, user, template_vars, report_name, fmt):
         # Render into a temp directory: the plugin directory is source, not an
-        # output location. create_download copies the file out before cleanup.
-        with tempfile.TemporaryDirectory() as tmp_dir:
+        # output location. create_download links the file out before cleanup.
+        with (
+            self.pdf_pool(workers if fmt == "pdf" else 1) as pool,
+            tempfile.TemporaryDirectory(dir=self.tmp_dir) as tmp_dir,
+        ):
             tmp_dir = Path(tmp_dir)
-            report = self.generate_report(
-                md_template=f"{report_name.lower()}_template.md",
-                temp_var=template_vars,
-                md_file=str(tmp_dir / f"{report_name}.md"),
-                pdf_out=str(tmp_dir / f"{report_name}.pdf"),
-                fmt=fmt,
-            )
+            pending = []
+            for report_name, template_vars in reports:
+                metrics = instrumentation.start(report_name)
+                md_file = str(tmp_dir / f"{report_name}.md")
+                pdf_out = str(tmp_dir / f"{report_name}.pdf")
+                exported = fmt in TABLE_FORMATS or fmt == LAYER_FORMAT
+                # Held from building the template vars until they're rendered:
+                # an incremental report's saved state is truncated when it's
+                # loaded and appended to while rendering, so two jobs on the
+                # same report (a scheduled refresh and an operator's request)
+                # would corrupt it.
+                with self.report_lock(report_name):
+                    with metrics.stage("template_vars"):
+                        temp_var = template_vars()
+                    if exported:
+                        extension = "json" if fmt == LAYER_FORMAT else fmt
+                        export = str(tmp_dir / f"{report_name}.{extension}")
+                        with metrics.stage("render"):
+                            metrics.rows = write_export(temp_var, fmt, export)
+                    else:
+                        chunked = (
+                            fmt == "pdf" and chunk_size > 0 and has_table(temp_var)
+                        )
+                        with metrics.stage("render"):
+                            if chunked:
+                                md_files = self.render_chunks(
+                                    report_name, temp_var, chunk_size, tmp_dir
+                                )
+                            else:
+                                self.render_markdown(
+                                    f"{report_name.lower()}_template.md",
+                                    temp_var,
+                                    md_file,
+                                )
+                                md_files = [(md_file, None)]
+                        metrics.rows = row_count(temp_var)
+                if exported:
+                    instrumentation.record_peak(metrics)
+                    upload(metrics, export, None)
+                    continue
+                if fmt == "md":
+                    instrumentation.record_peak(metrics)
+                    upload(metrics, md_file, None)
+                    continue
+                if fmt == "html":
+                    html_out = str(tmp_dir / f"{report_name}.html")
+                    with metrics.stage("html"):
+                        # The download has to open anywhere, not just next to
+                        # the plugin's templates directory.
+                        write_html(
+                            md_file, html_out, self.stylesheet, report_name, self.logo
+                        )
+                    instrumentation.record_peak(metrics)
+                    upload(metrics, html_out, None)
+                    continue
 
-            # Whichever file the requested format produced, not a fixed .pdf.
-            return self.main_menu.downloadsv2.create_download(db, user, Path(report))
+                # Identical markdown, stylesheet and logo make an identical
+                # PDF, so a hit skips the conversion entirely.
+                with metrics.stage("pdf"):
+                    key = self.pdf_cache.key(
+                        *(md for md, _ in md_files), self.stylesheet, self.logo
+                    )
+                    cache_hit = self.pdf_cache.fetch(key, pdf_out)
+                    if not cache_hit and chunked:
+                        self.convert_chunks(md_files, pdf_out, pool)
+                        self.pdf_cache.store(key, pdf_out)
+                    elif not cache_hit and pool is None:
+                        self.convert_pdf(md_file, pdf_out)
+                        self.pdf_cache.store(key, pdf_out)
+                # Only this process's allocations: pooled conversions are in
+                # the workers.
+                instrumentation.record_peak(metrics)
+                if pool is None or chunked:
+                    upload(metrics, pdf_out, cache_hit)
+                    continue
+
+                future = None
+                if not cache_hit:
+                    future = pool.submit(
+                        render_pdf, pdf_out, md_file, self.stylesheet, self.logo
+                    )
+                pending.append((metrics, key, pdf_out, future))
+
+            # Uploaded in report order, whichever conversion finishes first.
+            for metrics, key, pdf_out, future in pending:
+                if future is not None:
+                    # Time spent waiting on the pool, not the conversion itself.
+                    with metrics.stage("pdf_wait"):
+                        try:
+                            future.result()
+                        except BrokenProcessPool:
+                            # A crashed worker poisons the whole pool; replace
+                            # it on the next run rather than failing every report.
+                            with self._pdf_pool_lock:
+                                self._retire_pdf_pool(pool)
+                            raise
+                    self.pdf_cache.store(key, pdf_out)
+                upload(metrics, pdf_out, future is None)
+            return db_downloads
+
+    def report_lock(self, report_name):
+        with self._report_locks_lock:
+            return self._report_locks.setdefault(report_name, threading.Lock())
+
+    def create_download(self, db, user, report: Path):
+        """
+        Upload report, or hand back the download an identical earlier report
+        was uploaded as.
+        """
+        key = self.artifacts.key(report)
+        download_id = self.artifacts.download_id(key)
+        if download_id is not None:
+            db_download = db.get(models.Download, download_id)
+            # A rolled back or deleted record, or one whose id was reused.
+            if (
+                db_download is not None
+                and self.artifacts.download_id(key, db_download.location) is not None
+            ):
+                return db_download
+            self.artifacts.forget(key)
+
+        db_download = self.main_menu.downloadsv2.create_download(db, user, report)
+        if db_download.id is None:
+            db.flush()
+        self.artifacts.add(key, report, db_download.location, db_download.id)
+        return db_download
+
+
+def master_log_lines(rows, state):
+    # The banner opens the log once; incremental runs only append entries.
+    # An empty cache, not a missing watermark, since a run with no tasks
+    # saves the banner but no watermark.
+    if state.length == 0:
+        yield "=" * 50 + "\n\n"
+    for created_at, task_id, agent_id, username, task_input, task_output in rows:
+        # The output arrives after the task, so a task without it yet isn't
+        # cached, and is rendered again with its output on a later run.
+        if task_output is None:
+            state.hold()
+        if not state.held:
+            state.watermark = task_id
+        if username is None:
+            username = "None"
+        yield (
+            f"\n{xstr(created_at)} - {xstr(task_id)} ({xstr(agent_id)})> "
+            f"{xstr(username)}\n {xstr(task_input)}\n {xstr(task_output)}\n"
+        )
+
+
+def session_watermark(watermark, row):
+    # The newest check-in time cached, and the sessions cached at it.
+    seen_time = row.firstseen_time.isoformat()
+    if watermark is not None and watermark[0] == seen_time:
+        return [seen_time, [*watermark[1], row.session_id]]
+    return [seen_time, [row.session_id]]
+
+
+def check_command(command):
+    """
+    Raise ValueError for options that would otherwise only fail once the
+    reports run, after a background request's task was queued.
+    """
+    for name in ("workers", "chunk_size"):
+        value = command.get(name) or 0
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be a whole number, not {value!r}") from None
+    check_version(command.get("version") or DEFAULT_VERSION)
+
+
+def write_export(data, fmt, path):
+    """
+    Write a layer, or stream a query's rows under its column names.
+    """
+    if fmt == LAYER_FORMAT:
+        return write_layer(data, path)
+    fields = [column["name"] for column in data.column_descriptions]
+    writer = write_csv if fmt == "csv" else write_jsonl
+    return writer(fields, data.yield_per(1000), path)
+
+
+def technique_external_id(technique):
+    try:
+        return technique["external_references"][0]["external_id"]
+    except (KeyError, IndexError):
+        return None
+
+
+def has_table(template_vars):
+    return any(isinstance(v, HtmlTable) for v in template_vars.values())
+
+
+def option_enabled(value):
+    """
+    Execution options arrive as "True"/"False" strings, or as bools once typed.
+    """
+    return str(value).lower() == "true"
 
 
 def xstr(s):
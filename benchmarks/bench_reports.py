@@ -0,0 +1,387 @@
+"""
+Benchmark how each report scales with the size of the Empire database.
+
+    python benchmarks/bench_reports.py [--volumes 1000,10000,100000]
+        [--reports session,credential,master,module,empire] [--formats md,pdf]
+        [--output results.jsonl] [--baseline old.jsonl --tolerance 0.25]
+
+Every case runs in its own interpreter against an in-memory SQLite database
+filled with synthetic Agent, Credential and AgentTask rows, a stub main_menu
+and a generated ATT&CK tree, so nothing touches the network or a real
+server. Each case emits one JSON line with the wall time, peak RSS and a
+per-stage breakdown:
+
+    query     building the template vars
+    jinja     rendering the template to markdown (queries and tables are
+              streamed through the templates, so most of the work lands here)
+    pdf       converting markdown to PDF
+
+With --baseline, cases whose wall time grew by more than --tolerance against
+a previous results file are listed and the exit status is 1.
+
+Needs the Empire server importable, e.g. run from Empire's poetry shell.
+"""
+
+import argparse
+import importlib.util
+import json
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+
+REPORT_METHODS = {
+    "session": ("session_report", "session_template_vars"),
+    "credential": ("credential_report", "credential_template_vars"),
+    "master": ("master_log", "master_log_template_vars"),
+    "module": ("module_report", "module_template_vars"),
+    "empire": ("empire_report", "empire_template_vars"),
+}
+
+# Synthetic modules tasked by the AgentTask rows, spread across techniques
+# and sub-techniques so module_report has real matching to do.
+MODULE_COUNT = 200
+TECHNIQUE_COUNT = 670
+BATCH_SIZE = 10_000
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location(
+        "report_generation_plugin",
+        PLUGIN_DIR / "__init__.py",
+        submodule_search_locations=[str(PLUGIN_DIR)],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = package
+    spec.loader.exec_module(package)
+    return importlib.import_module("report_generation_plugin.advanced_reporting")
+
+
+def technique_id(i):
+    # Every fourth technique is a sub-technique of the one before it.
+    parent = 1000 + i // 4 * 4
+    return f"T{parent}" if i % 4 == 0 else f"T{parent}.{i % 4:03d}"
+
+
+def write_attack_fixture(install_path):
+    """
+    A small enterprise-attack tree in the layout load_database expects.
+    """
+    attack_dir = install_path / "data" / "cti-ATT-CK-v8.2" / "enterprise-attack"
+
+    def write(obj):
+        type_dir = attack_dir / obj["type"]
+        type_dir.mkdir(parents=True, exist_ok=True)
+        bundle = {"type": "bundle", "id": f"bundle--{obj['id']}", "objects": [obj]}
+        (type_dir / f"{obj['id']}.json").write_text(json.dumps(bundle))
+
+    write(
+        {
+            "type": "tool",
+            "id": "tool--empire",
+            "name": "Empire",
+            "description": "Empire is an open source post-exploitation framework.",
+            "x_mitre_platforms": ["Linux", "macOS", "Windows"],
+            "x_mitre_aliases": ["Empire", "PowerShell Empire"],
+            "external_references": [
+                {"source_name": "mitre-attack", "external_id": "S0363"}
+            ],
+        }
+    )
+    for i in range(TECHNIQUE_COUNT):
+        write(
+            {
+                "type": "attack-pattern",
+                "id": f"attack-pattern--{i}",
+                "name": f"Technique {technique_id(i)}",
+                "description": f"Synthetic description {i}. " * 20,
+                "created": "2020-01-01T00:00:00.000Z",
+                "x_mitre_platforms": ["Windows"],
+                "kill_chain_phases": [
+                    {"kill_chain_name": "mitre-attack", "phase_name": "execution"}
+                ],
+                "external_references": [
+                    {"source_name": "mitre-attack", "external_id": technique_id(i)}
+                ],
+            }
+        )
+        if i % 3 == 0:
+            write(
+                {
+                    "type": "relationship",
+                    "id": f"relationship--empire-{i}",
+                    "relationship_type": "uses",
+                    "source_ref": "tool--empire",
+                    "target_ref": f"attack-pattern--{i}",
+                }
+            )
+    (attack_dir.parent / ".empire_complete").touch()
+
+
+def placeholder(column, i):
+    """
+    A value for a NOT NULL column the benchmark doesn't care about.
+    """
+    column_type = column.type
+    enum_class = getattr(column_type, "enum_class", None)
+    if enum_class is not None:
+        return next(iter(enum_class))
+    if getattr(column_type, "enums", None):
+        return column_type.enums[0]
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        python_type = getattr(column_type, "impl", column_type).python_type
+    if python_type is bool:
+        return False
+    if python_type is int:
+        return i
+    if python_type is float:
+        return 0.0
+    if python_type is datetime:
+        return datetime.now(UTC)
+    if python_type is bytes:
+        return b""
+    if python_type in (dict, list):
+        return python_type()
+    return f"{column.name}-{i}"
+
+
+def insert(conn, table, count, row_for):
+    required = [
+        c
+        for c in table.columns
+        if not c.nullable
+        and c.default is None
+        and c.server_default is None
+        and not (c.primary_key and c.autoincrement in (True, "auto"))
+    ]
+    for start in range(0, count, BATCH_SIZE):
+        rows = []
+        for i in range(start, min(start + BATCH_SIZE, count)):
+            row = {c.name: placeholder(c, i) for c in required}
+            # Tolerates columns a given Empire version doesn't have.
+            row.update({k: v for k, v in row_for(i).items() if k in table.c})
+            rows.append(row)
+        conn.execute(table.insert(), rows)
+
+
+def populate(engine, models, volume, module_ids):
+    """
+    volume agents, credentials and tasks, with credentials repeating across
+    hosts the way harvested ones do.
+    """
+    epoch = datetime(2024, 1, 1, tzinfo=UTC)
+    with engine.begin() as conn:
+        insert(conn, models.User.__table__, 1, lambda i: {"id": 1, "username": "bench"})
+        insert(
+            conn,
+            models.Agent.__table__,
+            volume,
+            lambda i: {
+                "session_id": f"AGENT{i:08d}",
+                "name": f"AGENT{i:08d}",
+                "hostname": f"host-{i % 5000}",
+                "username": f"CORP\\user{i % 700}",
+                "firstseen_time": epoch + timedelta(seconds=i),
+            },
+        )
+        insert(
+            conn,
+            models.Credential.__table__,
+            volume,
+            lambda i: {
+                "id": i + 1,
+                "credtype": "hash" if i % 3 else "plaintext",
+                "domain": "CORP",
+                "username": f"user{i % 700}",
+                "password": f"P@ss<{i % 900}>&word",
+                "host": f"host-{i % 5000}",
+            },
+        )
+        insert(
+            conn,
+            models.AgentTask.__table__,
+            volume,
+            lambda i: {
+                "id": i + 1,
+                "agent_id": f"AGENT{i % max(volume, 1):08d}",
+                "user_id": 1,
+                "module_name": module_ids[i % len(module_ids)],
+                "input": f"Invoke-Something -Arg {i} " * 20,
+                "output": f"output line {i}\n" * 100,
+                "created_at": epoch + timedelta(seconds=i),
+            },
+        )
+
+
+class StubDownloads:
+    def __init__(self, download_dir):
+        self.download_dir = download_dir
+        self.count = 0
+
+    def create_download(self, db, user, path):
+        self.count += 1
+        location = self.download_dir / f"{self.count}-{path.name}"
+        shutil.copyfile(path, location)
+        return SimpleNamespace(
+            id=self.count, location=str(location), size=location.stat().st_size
+        )
+
+
+class Stages:
+    def __init__(self):
+        self.seconds = {"query": 0.0, "jinja": 0.0, "pdf": 0.0}
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+
+        return timed
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_case(report, fmt, volume):
+    from empire.server.core.db import models
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    module = load_plugin()
+    install_path = Path(tempfile.mkdtemp(prefix="report-bench-"))
+    try:
+        write_attack_fixture(install_path)
+        download_dir = install_path / "downloads"
+        download_dir.mkdir()
+
+        modules = {
+            f"powershell/bench/module{i}": SimpleNamespace(
+                name=f"powershell/bench/module{i}",
+                techniques=[technique_id(i * 3 % TECHNIQUE_COUNT)],
+            )
+            for i in range(MODULE_COUNT)
+        }
+        main_menu = SimpleNamespace(
+            install_path=install_path,
+            modulesv2=SimpleNamespace(modules=modules),
+            downloadsv2=StubDownloads(download_dir),
+        )
+
+        engine = create_engine(
+            "sqlite://",
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+        models.Base.metadata.create_all(engine)
+        populate(engine, models, volume, list(modules))
+
+        # Skips BasePlugin.__init__, which needs a live server; on_load only
+        # touches main_menu.
+        plugin = module.Plugin.__new__(module.Plugin)
+        plugin.main_menu = main_menu
+        plugin.on_load(None)
+
+        stages = Stages()
+        report_method, vars_method = REPORT_METHODS[report]
+        setattr(plugin, vars_method, stages.wrap("query", getattr(plugin, vars_method)))
+        plugin.render_markdown = stages.wrap("jinja", plugin.render_markdown)
+        plugin.convert_pdf = stages.wrap("pdf", plugin.convert_pdf)
+
+        rss_before = peak_rss_mb()
+        with sessionmaker(engine)() as db:
+            user = db.get(models.User, 1)
+            start = time.perf_counter()
+            download = getattr(plugin, report_method)(db, user, fmt)
+            wall = time.perf_counter() - start
+        return {
+            "report": report,
+            "format": fmt,
+            "volume": volume,
+            "wall_s": round(wall, 4),
+            "stages_s": {k: round(v, 4) for k, v in stages.seconds.items()},
+            "rss_before_mb": round(rss_before, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "output_bytes": download.size,
+        }
+    finally:
+        shutil.rmtree(install_path, ignore_errors=True)
+
+
+def regressions(results, baseline_file, tolerance):
+    baseline = {}
+    for line in Path(baseline_file).read_text().splitlines():
+        if line.strip():
+            case = json.loads(line)
+            baseline[(case["report"], case["format"], case["volume"])] = case
+    for case in results:
+        old = baseline.get((case["report"], case["format"], case["volume"]))
+        if old and case["wall_s"] > old["wall_s"] * (1 + tolerance):
+            yield case, old
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--volumes", default="1000,10000,100000")
+    parser.add_argument("--reports", default=",".join(REPORT_METHODS))
+    parser.add_argument("--formats", default="md,pdf")
+    parser.add_argument("--output", help="append JSON lines here too")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        report, fmt, volume = args.case.split(":")
+        print(json.dumps(run_case(report, fmt, int(volume))))
+        return
+
+    results = []
+    for volume in (int(v) for v in args.volumes.split(",")):
+        for report in args.reports.split(","):
+            for fmt in args.formats.split(","):
+                # A fresh interpreter per case keeps peak RSS per case too.
+                proc = subprocess.run(
+                    [sys.executable, __file__, "--case", f"{report}:{fmt}:{volume}"],
+                    capture_output=True,
+                    text=True,
+                    check=False,
+                )
+                if proc.returncode != 0:
+                    sys.exit(proc.stderr)
+                line = proc.stdout.strip().splitlines()[-1]
+                results.append(json.loads(line))
+                print(line, flush=True)
+                if args.output:
+                    with open(args.output, "a") as f:
+                        f.write(line + "\n")
+
+    if args.baseline:
+        slower = list(regressions(results, args.baseline, args.tolerance))
+        for case, old in slower:
+            print(
+                f"REGRESSION {case['report']}/{case['format']}/{case['volume']}: "
+                f"{old['wall_s']}s -> {case['wall_s']}s",
+                file=sys.stderr,
+            )
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
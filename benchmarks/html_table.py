@@ -0,0 +1,108 @@
+"""
+Compare the plugin's streaming HTML table emitter with tabulate.
+
+    python benchmarks/html_table.py [--rows 100000] [--repeat 3] [--json]
+
+Builds the same session-shaped table both ways, writing into a discarding
+sink, and reports the best wall time and the tracemalloc peak of each. The
+tabulate side is skipped when tabulate isn't installed; the plugin no longer
+needs it.
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import time
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+HEADER = ("SessionID", "Hostname", "User Name", "First Check-in")
+
+
+def load_tables():
+    # tables.py has no Empire imports, so it loads without a server.
+    spec = importlib.util.spec_from_file_location("tables", PLUGIN_DIR / "tables.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def rows(count):
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    for i in range(count):
+        yield (
+            f"SESSION{i:08d}",
+            f"host-{i % 500}.corp.local",
+            f"CORP\\user<{i % 2000}>",
+            start + timedelta(seconds=i),
+        )
+
+
+class Sink(io.TextIOBase):
+    def write(self, s):
+        return len(s)
+
+
+def streamed(tables, count):
+    sink = Sink()
+    for part in tables.HtmlTable(HEADER, tables.html_rows(rows(count))):
+        sink.write(part)
+
+
+def tabulated(count):
+    from tabulate import tabulate
+
+    # What the reports did before: a list of rows, then one string.
+    Sink().write(tabulate([HEADER, *rows(count)], tablefmt="html"))
+
+
+def measure(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"best_s": round(best, 4), "peak_mb": round(peak / (1024 * 1024), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    tables = load_tables()
+    results = {
+        "rows": args.rows,
+        "streamed": measure(lambda: streamed(tables, args.rows), args.repeat),
+    }
+    try:
+        import tabulate  # noqa: F401
+    except ImportError:
+        results["tabulate"] = None
+    else:
+        results["tabulate"] = measure(lambda: tabulated(args.rows), args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"rows: {args.rows}")
+    for name in ("streamed", "tabulate"):
+        result = results[name]
+        if result is None:
+            print(f"{name:9} skipped (not installed)")
+            continue
+        print(f"{name:9} {result['best_s']:8.3f} s  peak {result['peak_mb']:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
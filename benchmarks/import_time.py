@@ -0,0 +1,118 @@
+"""
+Measure what importing and loading the plugin costs an Empire server.
+
+    python benchmarks/import_time.py [--eager] [--top N] [--json]
+
+The plugin is imported in a fresh interpreter under -X importtime, so
+modules cached by earlier runs can't hide anything. Reports the plugin's
+cumulative import time, the slowest modules it pulled in and how long
+on_load takes. --eager also imports WeasyPrint, markdown2 and jinja2 up front,
+which is what every server boot paid before they were deferred.
+
+Needs the Empire server importable, e.g. run from Empire's poetry shell.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+CHILD = """
+import importlib.util, json, pathlib, sys, tempfile, time
+
+plugin_dir, eager = pathlib.Path(sys.argv[1]), sys.argv[2] == "1"
+
+start = time.perf_counter()
+if eager:
+    import jinja2, markdown2, weasyprint
+spec = importlib.util.spec_from_file_location(
+    "report_generation_plugin",
+    plugin_dir / "__init__.py",
+    submodule_search_locations=[str(plugin_dir)],
+)
+package = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = package
+spec.loader.exec_module(package)
+module = importlib.import_module("report_generation_plugin.advanced_reporting")
+import_s = time.perf_counter() - start
+
+
+class MainMenu:
+    install_path = pathlib.Path(tempfile.mkdtemp())
+
+
+# Skips BasePlugin.__init__, which needs a live server; on_load only
+# touches main_menu.
+plugin = module.Plugin.__new__(module.Plugin)
+plugin.main_menu = MainMenu()
+start = time.perf_counter()
+plugin.on_load(None)
+on_load_s = time.perf_counter() - start
+
+print(json.dumps({"import_s": import_s, "on_load_s": on_load_s}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Yield (self_us, cumulative_us, module) from -X importtime output.
+    """
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = [f.strip() for f in line[len("import time:") :].split("|")]
+        if not fields[0].isdigit():
+            continue  # the header row
+        yield int(fields[0]), int(fields[1]), fields[2].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--eager", action="store_true")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            CHILD,
+            str(PLUGIN_DIR),
+            "1" if args.eager else "0",
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+
+    result = json.loads(proc.stdout)
+    imports = list(parse_importtime(proc.stderr))
+    result["eager"] = args.eager
+    result["modules_imported"] = len(imports)
+    result["slowest"] = [
+        {"module": module, "self_ms": self_us / 1000}
+        for self_us, _, module in sorted(imports, reverse=True)[: args.top]
+    ]
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"eager heavy imports: {args.eager}")
+    print(f"plugin import:       {result['import_s'] * 1000:8.1f} ms")
+    print(f"on_load:             {result['on_load_s'] * 1000:8.1f} ms")
+    print(f"modules imported:    {result['modules_imported']}")
+    print("slowest modules (self time):")
+    for entry in result["slowest"]:
+        print(f"  {entry['self_ms']:8.1f} ms  {entry['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compare converting many small reports with a fresh WeasyPrint setup per call,
+as md2pdf does, against the plugin's warm backend.
+
+    python benchmarks/pdf_backend.py [--reports 20] [--repeat 3] [--json]
+
+Each report is a short markdown file that references the logo, styled with
+the plugin's stylesheet. Reports the best wall time for the whole batch and
+the mean per report.
+"""
+
+import argparse
+import importlib.util
+import json
+import tempfile
+import time
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+STYLESHEET = PLUGIN_DIR / "templates" / "style.css"
+LOGO = PLUGIN_DIR / "templates" / "empire.png"
+
+
+def load_backend():
+    # pdf_backend.py has no Empire imports, so it loads without a server.
+    spec = importlib.util.spec_from_file_location(
+        "pdf_backend", PLUGIN_DIR / "pdf_backend.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_reports(directory, count):
+    paths = []
+    for i in range(count):
+        path = Path(directory) / f"report-{i}.md"
+        path.write_text(
+            f"![Empire]({LOGO})\n\n# Report {i}\n\n"
+            "| SessionID | Hostname |\n|---|---|\n"
+            + "".join(f"| SESSION{j:04d} | host-{j} |\n" for j in range(20))
+        )
+        paths.append(path)
+    return paths
+
+
+def cold(backend, reports, out):
+    # md2pdf's path: a new font configuration and stylesheet every time, and
+    # no image cache, so the logo is decoded again per report.
+    from weasyprint import CSS, HTML
+
+    try:
+        from weasyprint.text.fonts import FontConfiguration
+    except ImportError:
+        from weasyprint.fonts import FontConfiguration
+
+    for md_file in reports:
+        fonts = FontConfiguration()
+        css = CSS(filename=str(STYLESHEET), font_config=fonts)
+        HTML(string=backend.markdown_html(str(md_file)), base_url=".").write_pdf(
+            out, stylesheets=[css], font_config=fonts
+        )
+
+
+def warm(backend, reports, out):
+    for md_file in reports:
+        backend.render_pdf(out, str(md_file), str(STYLESHEET), str(LOGO))
+
+
+def measure(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--reports", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    backend = load_backend()
+    with tempfile.TemporaryDirectory() as tmp:
+        reports = write_reports(tmp, args.reports)
+        out = str(Path(tmp) / "out.pdf")
+        # Imports and the first warm-up are paid once, outside the timings.
+        backend.warm_backend(str(STYLESHEET), str(LOGO))
+        results = {"reports": args.reports}
+        for name, func in (("cold", cold), ("warm", warm)):
+            best = measure(lambda f=func: f(backend, reports, out), args.repeat)
+            results[name] = {
+                "best_s": round(best, 4),
+                "per_report_ms": round(best / args.reports * 1000, 2),
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"reports: {args.reports}")
+    for name in ("cold", "warm"):
+        result = results[name]
+        print(
+            f"{name:5} {result['best_s']:8.3f} s  {result['per_report_ms']:8.2f} ms/report"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import csv
+import json
+from datetime import datetime
+from html import escape
+
+from .pdf_backend import cached_data_uri, markdown_html
+
+# Formats that skip the templates and write query rows or an ATT&CK layer.
+TABLE_FORMATS = ("csv", "jsonl")
+LAYER_FORMAT = "navigator"
+
+NAVIGATOR_VERSIONS = {"navigator": "4.5", "layer": "4.5"}
+
+
+def write_csv(fields, rows, path) -> int:
+    """
+    Write rows under a header of fields as they're produced, returning how
+    many there were.
+    """
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_plain(v) for v in row])
+            count += 1
+    return count
+
+
+def write_jsonl(fields, rows, path) -> int:
+    """
+    Write one JSON object per row, keyed by fields, returning the row count.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(dict(zip(fields, map(_plain, row), strict=True))))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def write_html(md_file, html_out, stylesheet, title, logo=""):
+    """
+    Convert the rendered markdown the way the PDFs are, but stop at the HTML
+    and embed the stylesheet and logo, so the page stands on its own.
+    """
+    body = markdown_html(md_file)
+    if logo:
+        # Swapped in after markdown, which is slow on a 100 KB link.
+        body = body.replace(f'src="{logo}"', f'src="{cached_data_uri(logo)}"')
+    with open(stylesheet, encoding="utf-8") as f:
+        css = f.read()
+    with open(html_out, "w", encoding="utf-8") as f:
+        f.write(
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+            f"<title>{escape(title)}</title>\n<style>\n{css}</style>\n"
+            f"</head>\n<body>\n{body}</body>\n</html>\n"
+        )
+
+
+def navigator_layer(name, description, attack_version, techniques) -> dict:
+    """
+    An ATT&CK Navigator layer scoring each technique. techniques holds
+    (technique_id, score, comment, modules) tuples.
+    """
+    return {
+        "name": name,
+        # The Navigator takes the major release only.
+        "versions": {"attack": attack_version.split(".")[0], **NAVIGATOR_VERSIONS},
+        "domain": "enterprise-attack",
+        "description": description,
+        "techniques": [
+            {
+                "techniqueID": technique_id,
+                "score": score,
+                "comment": comment,
+                "enabled": True,
+                "metadata": [{"name": "module", "value": m} for m in modules],
+                "showSubtechniques": False,
+            }
+            for technique_id, score, comment, modules in techniques
+        ],
+        "gradient": {
+            "colors": ["#ffffff", "#66b1ff"],
+            "minValue": 0,
+            "maxValue": max((t[1] for t in techniques), default=1),
+        },
+        "legendItems": [],
+        "hideDisabled": False,
+    }
+
+
+def write_layer(layer, path) -> int:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(layer, f, indent=2)
+    return len(layer["techniques"])
+
+
+def _plain(value):
+    # Timestamps as ISO 8601 in both formats; enums by their value.
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, "value", value)
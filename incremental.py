@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Bump whenever the shape of a cached fragment changes.
+FRAGMENT_VERSION = 3
+
+
+class ReportState:
+    """
+    Watermark and rendered body fragments kept for one report between runs.
+
+    A disabled state (no state_dir) has no watermark and persists nothing, so
+    reports can use the same code path for full and incremental runs.
+    """
+
+    def __init__(self, state_dir: Path | None, report_name: str, fingerprint: str):
+        self.watermark = None
+        self.data = {}
+        self.length = 0
+        self.held = False
+        self.meta_path = None
+        self.fragments_path = None
+        if state_dir is None:
+            return
+
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.meta_path = state_dir / f"{report_name}.json"
+        self.fragments_path = state_dir / f"{report_name}.fragments"
+        self.fingerprint = fingerprint
+
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except (OSError, ValueError):
+            meta = {}
+        if (
+            meta.get("fingerprint") == fingerprint
+            and self.fragments_path.is_file()
+            and self.fragments_path.stat().st_size >= meta.get("length", 0)
+        ):
+            self.watermark = meta.get("watermark")
+            self.data = meta.get("data", {})
+            self.length = meta.get("length", 0)
+
+        # Drop anything a failed run appended past the last saved length.
+        with open(self.fragments_path, "a") as f:
+            f.truncate(self.length)
+
+    @property
+    def enabled(self):
+        return self.meta_path is not None
+
+    def hold(self):
+        """
+        Keep the current new fragment and all after it out of the cache. Rows
+        that may still change are rendered, but left past the watermark, so
+        the next run queries and renders them again.
+        """
+        self.held = True
+
+    def reset(self):
+        """
+        Forget the cache, for when the rows it was rendered from changed.
+        """
+        self.watermark = None
+        self.data = {}
+        self.length = 0
+        if self.enabled:
+            with open(self.fragments_path, "a") as f:
+                f.truncate(0)
+
+    def fragments(self, new_fragments):
+        """
+        Yield the cached fragments followed by the new ones, appending the new
+        ones to the cache until hold() is called. The state is saved once the
+        new ones are exhausted.
+        """
+        if not self.enabled:
+            yield from new_fragments
+            return
+
+        # By line, so a cached table body comes back one row at a time.
+        with open(self.fragments_path, encoding="utf-8", newline="") as f:
+            yield from f
+
+        with open(self.fragments_path, "a", encoding="utf-8") as f:
+            for fragment in new_fragments:
+                if not self.held:
+                    f.write(fragment)
+                yield fragment
+        self.length = self.fragments_path.stat().st_size
+        self.save()
+
+    def save(self):
+        if not self.enabled:
+            return
+        tmp = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "fingerprint": self.fingerprint,
+                    "watermark": self.watermark,
+                    "data": self.data,
+                    "length": self.length,
+                }
+            )
+        )
+        os.replace(tmp, self.meta_path)
+
+
+def fingerprint(*paths: Path) -> str:
+    """
+    Identify the inputs a cached body was rendered against, so changing a
+    template (or the fragment format) falls back to a full rebuild.
+    """
+    digest = hashlib.sha256(str(FRAGMENT_VERSION).encode())
+    for path in paths:
+        stat = path.stat()
+        digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return digest.hexdigest()
@@ -0,0 +1,129 @@
+import cProfile
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# cProfile and tracemalloc are process-wide, and report jobs run concurrently:
+# instrumented runs take turns, so one can't stop the other's tracing, reset
+# its peaks or fail to start a second profiler.
+_exclusive = threading.Lock()
+
+
+class RowCounter:
+    """
+    Counts rows as a generator hands them to the template, for reports whose
+    rows are streamed rather than held in a list.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, rows):
+        for row in rows:
+            self.count += 1
+            yield row
+
+
+class ReportMetrics:
+    def __init__(self, report_name):
+        self.report_name = report_name
+        self.stages = {}
+        self.rows = None
+        self.output_bytes = None
+        self.peak_memory = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            "report": self.report_name,
+            "rows": self.rows,
+            "output_bytes": self.output_bytes,
+            "peak_memory_bytes": self.peak_memory,
+            "stages_s": {k: round(v, 4) for k, v in self.stages.items()},
+        }
+
+    def summary(self):
+        stages = ", ".join(f"{k} {v:.3f}s" for k, v in self.stages.items())
+        line = f"[*] {self.report_name}: {sum(self.stages.values()):.3f}s ({stages})"
+        if self.rows is not None:
+            line += f", {self.rows} rows"
+        if self.output_bytes is not None:
+            line += f", {self.output_bytes / 1024:.1f} KiB"
+        if self.peak_memory is not None:
+            line += f", peak {self.peak_memory / (1024 * 1024):.1f} MiB"
+        return line + "\n"
+
+
+class Instrumentation:
+    """
+    Stage timings, row counts, output sizes and tracemalloc peaks for each
+    report in a run, plus an optional cProfile of the whole run. When
+    disabled the metrics are still collected (a few perf_counter calls) but
+    nothing is traced, logged or reported. Instrumented runs wait for each
+    other; peaks still include what uninstrumented jobs allocate meanwhile.
+    """
+
+    def __init__(self, enabled=False, profile=False):
+        self.enabled = enabled
+        self.reports = []
+        self.profiler = cProfile.Profile() if profile else None
+        self._started_tracing = False
+        self._exclusive = False
+
+    def __enter__(self):
+        if self.enabled or self.profiler is not None:
+            _exclusive.acquire()
+            self._exclusive = True
+        # Leave tracemalloc alone if something outside the plugin traces.
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        if self._exclusive:
+            self._exclusive = False
+            _exclusive.release()
+
+    def start(self, report_name):
+        metrics = ReportMetrics(report_name)
+        if self.enabled:
+            self.reports.append(metrics)
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+        return metrics
+
+    def record_peak(self, metrics):
+        if self.enabled and tracemalloc.is_tracing():
+            metrics.peak_memory = tracemalloc.get_traced_memory()[1]
+
+    def finish(self, metrics):
+        if self.enabled:
+            log.info(f"report_metrics {json.dumps(metrics.as_dict())}")
+
+    def dump_profile(self, path):
+        self.profiler.dump_stats(path)
+
+
+def row_count(template_vars):
+    rows = template_vars.get("row_count")
+    return rows.count if isinstance(rows, RowCounter) else rows
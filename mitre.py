@@ -1,272 +1,544 @@
 import json
-import shutil
-import tarfile
-import urllib.request
-from itertools import chain
+import logging
+import os
+import pickle
+import re
+import threading
+from pathlib import Path
+
+from .provisioning import DatasetNotProvisioned
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = "attack-index.pickle"
+# Bump whenever AttackIndex or the compacted fields change shape.
+SNAPSHOT_VERSION = 2
+
+DEFAULT_VERSION = "8.2"
+# Indexes kept in memory at once; reports against other versions reload theirs
+# from its snapshot.
+MAX_INDEXES = 3
+
+# Everything the reports and helpers below read. The rest of each object
+# (citations, contributors, detection text, ...) is dropped from the snapshot.
+SNAPSHOT_FIELDS = (
+    "id",
+    "type",
+    "name",
+    "description",
+    "created",
+    "revoked",
+    "aliases",
+    "x_mitre_aliases",
+    "x_mitre_platforms",
+    "kill_chain_phases",
+    "tactic_refs",
+    "relationship_type",
+    "source_ref",
+    "target_ref",
+)
+
+
+def get_type_from_id(stix_id):
+    return stix_id.split("--", 1)[0]
+
+
+def split_technique_id(external_id):
+    """
+    Split "T1059.001" into ("T1059", "001"); a parent technique has no sub id.
+    """
+    parent_id, _, sub_id = external_id.partition(".")
+    return parent_id, sub_id or None
+
+
+def technique_id(obj):
+    """
+    The ATT&CK id (T1059.001, G0016, ...) of an object, or None.
+    """
+    for ref in obj.get("external_references", []):
+        if ref.get("source_name") == "mitre-attack" and "external_id" in ref:
+            return ref["external_id"]
+    return None
+
+
+class AttackIndex:
+    """
+    In-memory view of an extracted ATT&CK tree. Every lookup the reports make
+    is a dict hit instead of a walk over the thousands of JSON files.
+    """
+
+    def __init__(self, objects):
+        self.by_id = {}
+        self.by_type = {}
+        self.by_external_id = {}
+        self.by_alias = {}
+        self.by_name = {}
+        # source_ref -> relationships, and target_ref -> relationships
+        self.relationships_from = {}
+        self.relationships_to = {}
+        # revoked object id -> id of the object that replaced it
+        self.revoked_by = {}
+
+        for obj in objects:
+            self.add(obj)
+
+    @classmethod
+    def from_directory(cls, attack_dir):
+        return cls(_read_objects(Path(attack_dir)))
+
+    def add(self, obj):
+        # Trees that ship a bundle next to the per-object files list each
+        # object twice; the first copy wins.
+        if obj["id"] in self.by_id:
+            return
+        self.by_id[obj["id"]] = obj
+        self.by_type.setdefault(obj["type"], []).append(obj)
+
+        if obj["type"] == "relationship":
+            self.relationships_from.setdefault(obj["source_ref"], []).append(obj)
+            self.relationships_to.setdefault(obj["target_ref"], []).append(obj)
+            if obj["relationship_type"] == "revoked-by":
+                self.revoked_by[obj["source_ref"]] = obj["target_ref"]
+            return
+
+        for ref in obj.get("external_references", []):
+            if "external_id" in ref:
+                self.by_external_id.setdefault(ref["external_id"], []).append(obj)
+        if "name" in obj:
+            self.by_name.setdefault(obj["name"], []).append(obj)
+        # Groups carry "aliases", software carries "x_mitre_aliases".
+        for alias in obj.get("aliases", []) + obj.get("x_mitre_aliases", []):
+            self.by_alias.setdefault(alias, []).append(obj)
+
+    def of_type(self, typ):
+        return self.by_type.get(typ, [])
+
+    def relationships(
+        self, stix_id, relationship_type=None, source_only=False, target_only=False
+    ):
+        relations = []
+        if not target_only:
+            relations += self.relationships_from.get(stix_id, [])
+        if not source_only:
+            relations += self.relationships_to.get(stix_id, [])
+        if relationship_type is None:
+            return relations
+        return [r for r in relations if r["relationship_type"] == relationship_type]
+
+    def current(self, stix_id):
+        """
+        The object that stands for stix_id now: itself unless revoked, else
+        the end of its revoked-by chain. None when a revoked object names no
+        live replacement.
+        """
+        seen = set()
+        while stix_id in self.revoked_by and stix_id not in seen:
+            seen.add(stix_id)
+            stix_id = self.revoked_by[stix_id]
+        obj = self.by_id.get(stix_id)
+        if obj is None or obj.get("revoked", False):
+            return None
+        return obj
+
+    def objects(self, stix_ids, types=None):
+        """
+        Resolve ids to objects, preserving order and dropping duplicates.
+        """
+        objs = []
+        for stix_id in dict.fromkeys(stix_ids):
+            obj = self.by_id.get(stix_id)
+            if obj is not None and (types is None or obj["type"] in types):
+                objs.append(obj)
+        return objs
+
+
+def _read_objects(attack_dir):
+    # Newer releases ship the domain as one bundle (next to, or instead of,
+    # the per-object tree, plus a copy per past release). The bundle is the
+    # whole domain, so it is all that needs reading. Otherwise files are
+    # sorted so report ordering doesn't depend on directory listing order.
+    bundle = attack_dir / f"{attack_dir.name}.json"
+    paths = [bundle] if bundle.is_file() else sorted(attack_dir.rglob("*.json"))
+    for path in paths:
+        with open(path, "rb") as f:
+            data = json.load(f)
+        if data.get("type") == "bundle":
+            yield from map(_compact, data.get("objects", []))
+        else:
+            yield _compact(data)
+
+
+def _compact(obj):
+    compact = {key: obj[key] for key in SNAPSHOT_FIELDS if key in obj}
+    if "external_references" in obj:
+        # List order is kept: callers read external_references[0].
+        compact["external_references"] = [
+            {k: ref[k] for k in ("source_name", "external_id") if k in ref}
+            for ref in obj["external_references"]
+        ]
+    return compact
+
+
+def load_snapshot(snapshot, marker_mtime):
+    """
+    Return the pickled index if it was built from the current tree, else None.
+    """
+    try:
+        with open(snapshot, "rb") as f:
+            version, mtime, state = pickle.load(f)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        return None
+    if version != SNAPSHOT_VERSION or mtime != marker_mtime:
+        return None
+    # Plain containers rather than the AttackIndex instance, so the snapshot
+    # doesn't depend on the import path the plugin was loaded under.
+    index = AttackIndex.__new__(AttackIndex)
+    index.__dict__.update(state)
+    return index
+
+
+def write_snapshot(snapshot, marker_mtime, index):
+    tmp = snapshot.with_name(snapshot.name + ".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                (SNAPSHOT_VERSION, marker_mtime, vars(index)),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        # Atomic, so a concurrent reader never maps a half-written file.
+        os.replace(tmp, snapshot)
+    except OSError as e:
+        tmp.unlink(missing_ok=True)
+        log.warning(f"Could not write ATT&CK snapshot {snapshot}: {e}")
+
+
+# Shared by every Attack instance in the process, keyed by data directory and
+# completion marker mtime so a re-extracted tree is picked up. Insertion order
+# is recency order.
+_index_lock = threading.Lock()
+_indexes: dict[tuple[str, int], AttackIndex] = {}
+
+
+def get_index(attack_dir, complete_marker):
+    marker_mtime = complete_marker.stat().st_mtime_ns
+    key = (str(attack_dir), marker_mtime)
+    with _index_lock:
+        index = _indexes.pop(key, None)
+        if index is None:
+            for stale in [k for k in _indexes if k[0] == key[0]]:
+                del _indexes[stale]
+            index = _load_index(
+                attack_dir, complete_marker.parent / SNAPSHOT_NAME, marker_mtime
+            )
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            del _indexes[next(iter(_indexes))]
+    return index
+
+
+def _load_index(attack_dir, snapshot, marker_mtime):
+    # The snapshot makes a cold start one unpickle instead of a parse of the
+    # whole tree; it is rebuilt whenever the marker is re-touched.
+    index = load_snapshot(snapshot, marker_mtime)
+    if index is None:
+        index = AttackIndex.from_directory(attack_dir)
+        write_snapshot(snapshot, marker_mtime, index)
+    return index
+
 
-from stix2 import FileSystemSource, Filter
-from stix2.utils import get_type_from_id
+def check_version(version):
+    # The version becomes a directory name, so nothing but digits and dots.
+    if not re.fullmatch(r"\d+(\.\d+)*", version):
+        raise ValueError(f"Invalid ATT&CK version: {version!r}")
+    return version
+
+
+def available_versions(main_menu):
+    """
+    Versions with a complete dataset under data/, oldest first.
+    """
+    data_dir = main_menu.install_path / "data"
+    versions = [
+        marker.parent.name.removeprefix("cti-ATT-CK-v")
+        for marker in data_dir.glob("cti-ATT-CK-v*/.empire_complete")
+    ]
+    return sorted(versions, key=lambda v: tuple(int(p) for p in v.split(".")))
 
 
 class Attack:
-    def __init__(self, main_menu):
+    def __init__(self, main_menu, version=DEFAULT_VERSION):
         self.main_menu = main_menu
+        self.version = check_version(version)
         self.fs = self.load_database()
 
     def get_commands(self):
         return self.commands
 
     def parse_json(self, mitre_json):
-        mitre_json = json.loads(mitre_json)
-        technique_list = []
-        for i in range(len(mitre_json["techniques"])):
-            # Finds techniques from group and filters out the sub-techniques
-            # TODO:  cannot do subtechniques so split
-            technique_list.append(
-                mitre_json["techniques"][i]["techniqueID"].split(".")[0]
-            )
-        disable_module_count = self.disable_modules(technique_list)
-        return disable_module_count
+        """
+        The technique ids a Navigator layer enables. Raises ValueError when
+        it enables none, since an empty filter would match no module.
+        """
+        name, techniques = next(iter(self.resolve_layers([mitre_json]).items()))
+        if not techniques:
+            raise ValueError(f"Layer {name!r} enables no techniques")
+        return techniques
 
     def threat_filtering(self, threat_name):
-        # Load MITRE CLI database
-        fs = self.load_database()
-        alias = self.get_group_by_alias(fs, threat_name)
-        techniques = self.get_technique_by_group(fs, alias[0]._inner["id"])
-        technique_list = []
-        for i in range(len(techniques)):
-            # Finds techniques from group and filters out the sub-techniques
-            # TODO:  cannot do subtechniques so split
-            technique_list.append(
-                techniques[i]
-                ._inner["external_references"][0]
-                ._inner["external_id"]
-                .split(".")[0]
-            )
-        disable_module_count = self.disable_modules(technique_list)
-        return disable_module_count
+        """
+        The technique ids a group uses. Raises ValueError for a group this
+        version doesn't know, or one with no techniques.
+        """
+        techniques = self.resolve_groups([threat_name])[threat_name]
+        if not techniques:
+            raise ValueError(f"No techniques found for group {threat_name!r}")
+        return techniques
+
+    def resolve_groups(self, names, include_software=False):
+        """
+        Map each group name, alias or ATT&CK id (G0016) to the ids of the
+        techniques it uses, sub-techniques included and revoked techniques
+        replaced. include_software adds the techniques of the software the
+        group uses. Unknown names map to an empty set.
+        """
+        # Built once per call, so N names cost N dict hits.
+        exact = {}
+        folded = {}
+        for group in self.get_all_groups(self.fs):
+            keys = [group["name"], technique_id(group), *group.get("aliases", [])]
+            for key in filter(None, keys):
+                exact.setdefault(key, group)
+                folded.setdefault(key.lower(), group)
+
+        resolved = {}
+        for name in names:
+            group = exact.get(name) or folded.get(name.strip().lower())
+            if group is None:
+                resolved[name] = set()
+                continue
+            sources = [group["id"]]
+            if include_software:
+                sources += [
+                    r["target_ref"]
+                    for r in self.fs.relationships_from.get(group["id"], [])
+                    if r["relationship_type"] == "uses"
+                    and get_type_from_id(r["target_ref"]) in ["malware", "tool"]
+                ]
+            resolved[name] = self.used_technique_ids(sources)
+        return resolved
+
+    def resolve_layers(self, layers):
+        """
+        Map each ATT&CK Navigator layer (JSON text, a parsed dict or a path to
+        a .json file) to the ids of its enabled techniques, keyed by layer
+        name, sub-techniques kept as they are.
+        """
+        resolved = {}
+        for i, layer in enumerate(layers):
+            if isinstance(layer, Path) or (
+                isinstance(layer, str) and layer.endswith(".json")
+            ):
+                layer = Path(layer).read_text()
+            if isinstance(layer, str | bytes):
+                layer = json.loads(layer)
+            ids = {
+                t["techniqueID"].strip().upper()
+                for t in layer.get("techniques", [])
+                if t.get("techniqueID") and t.get("enabled", True)
+            }
+            current = self.current_technique_ids(ids)
+            resolved[layer.get("name") or f"layer-{i}"] = {
+                current.get(t, t) for t in ids
+            }
+        return resolved
+
+    def used_technique_ids(self, stix_ids):
+        """
+        Ids of the techniques any of stix_ids "uses", straight off the
+        relationship adjacency lists.
+        """
+        used = set()
+        for stix_id in stix_ids:
+            for r in self.fs.relationships_from.get(stix_id, []):
+                if r["relationship_type"] != "uses" or not r["target_ref"].startswith(
+                    "attack-pattern--"
+                ):
+                    continue
+                technique = self.fs.current(r["target_ref"])
+                if technique is not None and technique_id(technique):
+                    used.add(technique_id(technique))
+        return used
 
     def attack_searcher(self):
-        # Load MITRE CLI database
-        fs = self.load_database()
-        software = self.get_software_by_alias(fs, "Empire")[0]
-        techniques = self.get_techniques_by_software(fs, software)
-        return software, techniques
+        software = self.get_software_by_alias(self.fs, "Empire")[0]
+        techniques = self.get_techniques_by_software(self.fs, software["id"])
+        # Relationships can still point at techniques revoked since.
+        current = [self.fs.current(t["id"]) for t in techniques]
+        return software, list({t["id"]: t for t in current if t is not None}.values())
 
     def all_attacks(self):
-        # Load MITRE CLI database
-        fs = self.load_database()
-        techniques = self.get_all_techniques(fs)
-        return techniques
+        return self.get_all_techniques(self.fs)
 
     def get_by_attack_id(self, src, ID):
-        tech = src.query([Filter("external_references.external_id", "=", "G0075")])[0]
-        return tech
+        return src.by_external_id[ID][0]
 
     def get_techniques(self, group_name):
         group = self.get_group_by_alias(self.fs, group_name)[0]
-        techniques = self.get_technique_by_group(self.fs, group)
+        techniques = self.get_technique_by_group(self.fs, group["id"])
         return techniques
 
+    def current_technique_ids(self, external_ids):
+        """
+        Map ATT&CK ids to the id of the technique standing for each in this
+        version: itself, or whatever revoked it. Ids this version doesn't
+        know, or that were revoked without a replacement, are left out.
+        """
+        current_ids = {}
+        for external_id in external_ids:
+            for technique in self.get_object_by_attack_id(
+                self.fs, "attack-pattern", external_id
+            ):
+                current = self.fs.current(technique["id"])
+                if current is not None and current.get("external_references"):
+                    current_ids[external_id] = current["external_references"][0][
+                        "external_id"
+                    ]
+                    break
+        return current_ids
+
+    @staticmethod
+    def dataset_paths(main_menu, version=DEFAULT_VERSION):
+        data_dir = main_menu.install_path / "data"
+        attack_dir = (
+            data_dir / f"cti-ATT-CK-v{check_version(version)}" / "enterprise-attack"
+        )
+        # Gated on a marker rather than the directory existing: a partially
+        # extracted tree reads without error, with every missing type simply
+        # empty, so a truncated tree would report empty forever.
+        return data_dir, attack_dir, attack_dir.parent / ".empire_complete"
+
+    @classmethod
+    def dataset_ready(cls, main_menu, version=DEFAULT_VERSION):
+        return cls.dataset_paths(main_menu, version)[2].is_file()
+
     # mitre defined functions
     def load_database(self):
-        data_dir = self.main_menu.install_path / "data"
-        attack_dir = data_dir / "cti-ATT-CK-v8.2" / "enterprise-attack"
-        # Gated on a marker rather than the directory existing: FileSystemSource
-        # serves a partially extracted tree without error, returning [] for any
-        # missing type, so a truncated tree would report empty forever.
-        complete_marker = attack_dir.parent / ".empire_complete"
+        _, attack_dir, complete_marker = self.dataset_paths(
+            self.main_menu, self.version
+        )
 
         if not complete_marker.is_file():
-            database_tar = data_dir / "cti.tar.gz"
-            try:
-                urllib.request.urlretrieve(
-                    "https://github.com/mitre/cti/archive/refs/tags/ATT&CK-v8.2.tar.gz",
-                    filename=database_tar,
-                )
-                # Stage and move, so an interrupted extraction can't leave a
-                # half-written tree for the marker below to bless.
-                staging = data_dir / "cti-staging"
-                if staging.is_dir():
-                    shutil.rmtree(staging)
-                with tarfile.open(database_tar, "r:gz") as tar:
-                    tar.extractall(path=staging, filter="data")
-                # Renaming onto a non-empty directory raises ENOTEMPTY, and a
-                # leftover partial tree is exactly what reaches here.
-                shutil.rmtree(attack_dir.parent, ignore_errors=True)
-                (staging / attack_dir.parent.name).rename(attack_dir.parent)
-                complete_marker.touch()
-            finally:
-                database_tar.unlink(missing_ok=True)
-                shutil.rmtree(data_dir / "cti-staging", ignore_errors=True)
-
-        return FileSystemSource(str(attack_dir))
+            # Provisioning runs in the background from plugin start-up, never
+            # inside a report request.
+            raise DatasetNotProvisioned(
+                f"The ATT&CK dataset is not provisioned at {attack_dir.parent} yet; "
+                "check the plugin's attack_source setting and the server log"
+            )
+
+        return get_index(attack_dir, complete_marker)
 
     def get_all_software(self, src):
-        filts = [[Filter("type", "=", "malware")], [Filter("type", "=", "tool")]]
-        return list(chain.from_iterable(src.query(f) for f in filts))
+        return src.of_type("malware") + src.of_type("tool")
+
+    def get_all_groups(self, src):
+        return src.of_type("intrusion-set")
 
     def get_all_techniques(self, src):
-        filt = [Filter("type", "=", "attack-pattern")]
-        return src.query(filt)
+        return src.of_type("attack-pattern")
 
-    def get_technique_by_name(src, name):
-        filt = [Filter("type", "=", "attack-pattern"), Filter("name", "=", name)]
-        return src.query(filt)
+    def get_technique_by_name(self, src, name):
+        return [t for t in src.by_name.get(name, []) if t["type"] == "attack-pattern"]
 
     def get_techniques_by_content(self, src, content):
         techniques = self.get_all_techniques(src)
         return [
-            tech for tech in techniques if content.lower() in tech.description.lower()
+            tech
+            for tech in techniques
+            if content.lower() in tech.get("description", "").lower()
         ]
 
     def get_techniques_since_time(self, src, timestamp):
-        filt = [
-            Filter("type", "=", "attack-pattern"),
-            Filter("created", ">", timestamp),
-        ]
-        return src.query(filt)
+        return [t for t in self.get_all_techniques(src) if t["created"] > timestamp]
 
     def get_object_by_attack_id(self, src, typ, attack_id):
-        filt = [
-            Filter("type", "=", typ),
-            Filter("external_references.external_id", "=", attack_id),
-        ]
-        return src.query(filt)
+        return [o for o in src.by_external_id.get(attack_id, []) if o["type"] == typ]
 
     def get_group_by_alias(self, src, alias):
-        return src.query(
-            [Filter("type", "=", "intrusion-set"), Filter("aliases", "=", alias)]
-        )
+        return [g for g in src.by_alias.get(alias, []) if g["type"] == "intrusion-set"]
 
     def get_software_by_alias(self, src, alias):
-        return src.query([Filter("type", "=", "tool"), Filter("name", "=", alias)])
+        return [s for s in src.by_name.get(alias, []) if s["type"] == "tool"]
 
     def get_technique_by_group(self, src, stix_id):
         relations = src.relationships(stix_id, "uses", source_only=True)
-        return src.query(
-            [
-                Filter("type", "=", "attack-pattern"),
-                Filter("id", "in", [r.target_ref for r in relations]),
-            ]
-        )
+        return src.objects([r["target_ref"] for r in relations], {"attack-pattern"})
 
     def get_techniques_by_software(self, src, stix_id):
         relations = src.relationships(stix_id, "uses", source_only=True)
-        return src.query(
-            [
-                Filter("type", "=", "attack-pattern"),
-                Filter("id", "in", [r.target_ref for r in relations]),
-            ]
-        )
+        return src.objects([r["target_ref"] for r in relations], {"attack-pattern"})
 
     def get_techniques_by_group_software(self, src, group_stix_id):
         # get the malware, tools that the group uses
-        group_uses = [
-            r
+        software_ids = [
+            r["target_ref"]
             for r in src.relationships(group_stix_id, "uses", source_only=True)
-            if get_type_from_id(r.target_ref) in ["malware", "tool"]
+            if get_type_from_id(r["target_ref"]) in ["malware", "tool"]
         ]
 
         # get the technique stix ids that the malware, tools use
-        software_uses = src.query(
-            [
-                Filter("type", "=", "relationship"),
-                Filter("relationship_type", "=", "uses"),
-                Filter("source_ref", "in", [r.source_ref for r in group_uses]),
-            ]
-        )
+        technique_ids = [
+            r["target_ref"]
+            for software_id in software_ids
+            for r in src.relationships(software_id, "uses", source_only=True)
+        ]
 
         # get the techniques themselves
-        return src.query(
-            [
-                Filter("type", "=", "attack-pattern"),
-                Filter("id", "in", [r.target_ref for r in software_uses]),
-            ]
-        )
+        return src.objects(technique_ids, {"attack-pattern"})
 
     def get_technique_users(self, src, tech_stix_id):
-        groups = [
-            r.source_ref
-            for r in src.relationships(tech_stix_id, "uses", target_only=True)
-            if get_type_from_id(r.source_ref) == "intrusion-set"
-        ]
+        groups = []
+        software = []
+        for r in src.relationships(tech_stix_id, "uses", target_only=True):
+            source_type = get_type_from_id(r["source_ref"])
+            if source_type == "intrusion-set":
+                groups.append(r["source_ref"])
+            elif source_type in ["tool", "malware"]:
+                software.append(r["source_ref"])
 
-        software = [
-            r.source_ref
-            for r in src.relationships(tech_stix_id, "uses", target_only=True)
-            if get_type_from_id(r.source_ref) in ["tool", "malware"]
-        ]
-
-        return src.query(
-            [
-                Filter("type", "in", ["intrusion-set", "malware", "tool"]),
-                Filter("id", "in", groups + software),
-            ]
-        )
+        return src.objects(groups + software)
 
     def get_techniques_by_platform(self, src, platform):
-        return src.query(
-            [
-                Filter("type", "=", "attack-pattern"),
-                Filter("x_mitre_platforms", "=", platform),
-            ]
-        )
+        return [
+            t
+            for t in self.get_all_techniques(src)
+            if platform in t.get("x_mitre_platforms", [])
+        ]
 
     def get_tactic_techniques(self, src, tactic):
-        techs = src.query(
-            [
-                Filter("type", "=", "attack-pattern"),
-                Filter("kill_chain_phases.phase_name", "=", tactic),
-            ]
-        )
-
         # double checking the kill chain is MITRE ATT&CK
         return [
             t
-            for t in techs
+            for t in self.get_all_techniques(src)
             if {
                 "kill_chain_name": "mitre-attack",
                 "phase_name": tactic,
             }
-            in t.kill_chain_phases
+            in t.get("kill_chain_phases", [])
         ]
 
     def get_mitigations_by_technique(self, src, tech_stix_id):
         relations = src.relationships(tech_stix_id, "mitigates", target_only=True)
-        return src.query(
-            [
-                Filter("type", "=", "course-of-action"),
-                Filter("id", "in", [r.source_ref for r in relations]),
-            ]
-        )
+        return src.objects([r["source_ref"] for r in relations], {"course-of-action"})
 
     def getTacticsByMatrix(self, src):
         tactics = {}
-        matrix = src.query(
-            [
-                Filter("type", "=", "x-mitre-matrix"),
-            ]
-        )
-
-        for i in range(len(matrix)):
-            tactics[matrix[i]["name"]] = []
-            for tactic_id in matrix[i]["tactic_refs"]:
-                tactics[matrix[i]["name"]].append(
-                    src.query([Filter("id", "=", tactic_id)])[0]
-                )
+        for matrix in src.of_type("x-mitre-matrix"):
+            tactics[matrix["name"]] = src.objects(matrix["tactic_refs"])
 
         return tactics
 
     def getRevokedBy(self, stix_id, src):
-        relations = src.relationships(stix_id, "revoked-by", source_only=True)
-        revoked_by = src.query(
-            [
-                Filter("id", "in", [r.target_ref for r in relations]),
-                Filter("revoked", "=", False),
-            ]
-        )
-        if revoked_by is not None:
-            revoked_by = revoked_by[0]
-
-        return revoked_by
+        if stix_id not in src.revoked_by:
+            return None
+        return src.current(stix_id)
@@ -0,0 +1,163 @@
+import base64
+import inspect
+import mimetypes
+import os
+import threading
+
+# Markdown to PDF the way md2pdf does it, but md2pdf parses the stylesheet,
+# sets up fonts and decodes every image again on each call. Here they are
+# kept for the life of the process (the server, or a pool worker) and dropped
+# when the file they came from changes. WeasyPrint's objects are kept per
+# thread, since concurrent report jobs would otherwise share them.
+
+# What md2pdf passes to markdown2, so reports render the same.
+MARKDOWN_EXTRAS = ["cuddled-lists"]
+
+_lock = threading.Lock()
+_data_uris = {}
+_local = threading.local()
+
+# Run with exec() as a pool worker's initializer. Workers start from a fresh
+# interpreter, where the plugin can't be imported by its package name, so this
+# file is loaded under the name render_pdf is pickled by. Pickle imports that
+# name's top-level package as well; a placeholder stands in for it.
+WORKER_BOOTSTRAP = """\
+import importlib.util
+import sys
+import types
+
+spec = importlib.util.spec_from_file_location(name, path)
+module = importlib.util.module_from_spec(spec)
+sys.modules[name] = module
+spec.loader.exec_module(module)
+top = name.partition(".")[0]
+sys.modules.setdefault(top, types.ModuleType(top))
+module.warm_backend(css_file)
+"""
+
+
+def markdown_html(md_file: str) -> str:
+    import markdown2
+
+    return markdown2.markdown_path(md_file, extras=MARKDOWN_EXTRAS)
+
+
+def _state():
+    if not hasattr(_local, "font_config"):
+        try:
+            from weasyprint.text.fonts import FontConfiguration
+        except ImportError:
+            # Before WeasyPrint 53.
+            from weasyprint.fonts import FontConfiguration
+
+        _local.font_config = FontConfiguration()
+        _local.stylesheets = {}
+        # Decoded images by URL, while the files they came from are unchanged.
+        _local.image_cache = {}
+        _local.image_stamps = {}
+    return _local
+
+
+def font_config():
+    return _state().font_config
+
+
+def stylesheet(css_file: str):
+    """
+    The parsed stylesheet, re-parsed only when the file changes.
+    """
+    from weasyprint import CSS
+
+    mtime = os.stat(css_file).st_mtime_ns
+    state = _state()
+    cached = state.stylesheets.get(css_file)
+    if cached is None or cached[0] != mtime:
+        cached = state.stylesheets[css_file] = (
+            mtime,
+            CSS(filename=css_file, font_config=state.font_config),
+        )
+    return cached[1]
+
+
+def data_uri(path) -> str:
+    mime = mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode()}"
+
+
+def cached_data_uri(path: str) -> str:
+    """
+    path as a data URI, re-encoded only when the file changes.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _data_uris.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _data_uris[path] = (mtime, data_uri(path))
+        return cached[1]
+
+
+def image_cache(*paths):
+    """
+    The image cache, emptied first if any of paths changed since the last
+    conversion.
+    """
+    state = _state()
+    stamps = {path: os.stat(path).st_mtime_ns for path in paths}
+    if any(state.image_stamps.get(p) != stamp for p, stamp in stamps.items()):
+        state.image_cache.clear()
+        state.image_stamps.update(stamps)
+    return state.image_cache
+
+
+def render_pdf(
+    pdf_out: str, md_file: str, css_file: str, logo: str = "", base_url: str = "."
+):
+    """
+    Convert md_file to pdf_out as md2pdf would. A module-level function, so
+    it can be submitted to a process pool.
+    """
+    import weasyprint
+
+    html = weasyprint.HTML(string=markdown_html(md_file), base_url=base_url)
+    options = {}
+    option = _cache_option(weasyprint)
+    if option is not None:
+        options[option] = image_cache(logo) if logo else image_cache()
+    html.write_pdf(
+        pdf_out,
+        stylesheets=[stylesheet(css_file)],
+        font_config=font_config(),
+        **options,
+    )
+
+
+def _cache_option(weasyprint):
+    # WeasyPrint 59+ takes the image cache as "cache", 53 to 58 as
+    # "image_cache", and older releases not at all.
+    if "cache" in getattr(weasyprint, "DEFAULT_OPTIONS", {}):
+        return "cache"
+    if "image_cache" in inspect.signature(weasyprint.HTML.write_pdf).parameters:
+        return "image_cache"
+    return None
+
+
+def worker_initializer(css_file: str):
+    """
+    (initializer, initargs) for a process pool that runs render_pdf.
+    """
+    return exec, (
+        WORKER_BOOTSTRAP,
+        {"name": __name__, "path": __file__, "css_file": css_file},
+    )
+
+
+def warm_backend(css_file: str, logo: str = ""):
+    """
+    Pay for WeasyPrint's imports, the font setup and the stylesheet now, for
+    the calling thread, and with logo for its data URI.
+    """
+    stylesheet(css_file)
+    if logo:
+        cached_data_uri(logo)
+    import markdown2  # noqa: F401
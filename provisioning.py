@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tarfile
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+DATASET_URL = "https://github.com/mitre/cti/archive/refs/tags/ATT&CK-v{version}.tar.gz"
+# Per socket operation, so a stalled connection fails instead of hanging.
+DOWNLOAD_TIMEOUT = 60
+DOMAIN = "enterprise-attack"
+
+_provision_lock = threading.Lock()
+
+
+class DatasetNotProvisioned(Exception):
+    pass
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def provision(
+    data_dir: Path,
+    attack_dir: Path,
+    complete_marker: Path,
+    source: str = "",
+    sha256: str = "",
+    url: str | None = DATASET_URL,
+    timeout: float = DOWNLOAD_TIMEOUT,
+):
+    """
+    Install the enterprise-attack tree at attack_dir from a local tarball or
+    directory (source), or failing that by downloading url. The marker is
+    written only once the tree is complete. A no-op when it already is.
+    """
+    with _provision_lock:
+        if complete_marker.is_file():
+            return
+        data_dir.mkdir(parents=True, exist_ok=True)
+        staging = data_dir / "cti-staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            if source and Path(source).is_dir():
+                copy_domain(Path(source), staging / DOMAIN)
+            elif source:
+                verify(Path(source), sha256)
+                extract_domain(Path(source), staging / DOMAIN)
+            elif url:
+                # Named after the release's directory, so a partial download
+                # is only ever resumed for the release it came from.
+                archive = data_dir / f"{attack_dir.parent.name}.tar.gz"
+                download(url, archive, timeout)
+                try:
+                    verify(archive, sha256)
+                    extract_domain(archive, staging / DOMAIN)
+                finally:
+                    # Complete archives are never resumed, so whether it was
+                    # good or corrupt it has served its purpose.
+                    archive.unlink(missing_ok=True)
+            else:
+                raise ProvisioningError("No ATT&CK source configured")
+
+            # Renaming onto a non-empty directory raises ENOTEMPTY, and a
+            # leftover partial tree is exactly what reaches here.
+            shutil.rmtree(attack_dir, ignore_errors=True)
+            attack_dir.parent.mkdir(parents=True, exist_ok=True)
+            (staging / DOMAIN).rename(attack_dir)
+            complete_marker.touch()
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def expected_sha256(setting: str, version: str) -> str:
+    """
+    The SHA-256 the attack_sha256 setting gives for version: the whole value,
+    or its entry among comma-separated version=sha256 pairs. Empty only when
+    the setting is; a malformed value or a version without an entry raises
+    rather than skipping verification.
+    """
+    setting = setting.strip()
+    if "=" not in setting and "," not in setting:
+        return setting
+    pairs = {}
+    for entry in filter(None, (e.strip() for e in setting.split(","))):
+        key, sep, value = entry.partition("=")
+        if not sep or not key.strip() or not value.strip():
+            raise ProvisioningError(f"Malformed attack_sha256 entry: {entry!r}")
+        pairs[key.strip()] = value.strip()
+    if version not in pairs:
+        raise ProvisioningError(f"attack_sha256 has no entry for ATT&CK v{version}")
+    return pairs[version]
+
+
+def verify(path: Path, sha256: str):
+    if not sha256:
+        log.warning(f"No SHA-256 configured for {path}, skipping verification")
+        return
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    if digest.hexdigest() != sha256.strip().lower():
+        raise ProvisioningError(
+            f"SHA-256 mismatch for {path}: expected {sha256}, got {digest.hexdigest()}"
+        )
+
+
+def download(url: str, dest: Path, timeout: float):
+    """
+    Download url to dest, resuming a previous partial download with an HTTP
+    Range request when the server allows it.
+    """
+    part = dest.with_name(dest.name + ".part")
+    offset = part.stat().st_size if part.is_file() else 0
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            # 200 to a Range request means the server sent it all again.
+            mode = "ab" if offset and response.status == 206 else "wb"
+            with open(part, mode) as f:
+                shutil.copyfileobj(response, f, 1024 * 1024)
+    except urllib.error.HTTPError as e:
+        # Nothing left past the offset: the last attempt got everything.
+        if e.code != 416:
+            raise
+    os.replace(part, dest)
+
+
+def extract_domain(archive: Path, dest: Path):
+    """
+    Extract the enterprise-attack subtree of a cti archive into dest, reading
+    the archive as a stream: the other domains are skipped, not unpacked.
+    """
+    found = False
+    with tarfile.open(archive, "r|*") as tar:
+        for member in tar:
+            parts = Path(member.name).parts
+            if DOMAIN not in parts:
+                continue
+            # Rebased so dest is the enterprise-attack directory, whatever
+            # the archive's top-level directory is called.
+            rest = parts[parts.index(DOMAIN) + 1 :]
+            # Copies of the bundle as of every past release; never read.
+            if len(rest) == 1 and re.fullmatch(rf"{DOMAIN}-[\d.]+\.json", rest[0]):
+                continue
+            member.name = str(Path(*rest)) if rest else "."
+            tar.extract(member, dest, filter="data")
+            found = True
+    if not found:
+        raise ProvisioningError(f"No {DOMAIN} directory in {archive}")
+
+
+def copy_domain(source: Path, dest: Path):
+    if source.name != DOMAIN:
+        candidates = sorted(p for p in source.rglob(DOMAIN) if p.is_dir())
+        if not candidates:
+            raise ProvisioningError(f"No {DOMAIN} directory under {source}")
+        source = candidates[0]
+    shutil.copytree(source, dest, ignore=shutil.ignore_patterns(f"{DOMAIN}-*.json"))
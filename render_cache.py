@@ -0,0 +1,191 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+
+class PdfCache:
+    """
+    Converted PDFs addressed by a hash of everything that feeds the
+    conversion, bounded by total size with least-recently-used eviction.
+
+    Entries share their inode with the reports and downloads made from them,
+    so recency is the mtime of a "<key>.used" file next to each, never the
+    PDF's own.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, *paths) -> str:
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    digest.update(chunk)
+            # Separates inputs, so moving bytes between them changes the key.
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def fetch(self, key: str, dest: str) -> bool:
+        """
+        Place the cached PDF for key at dest, returning whether there was one.
+        """
+        cached = self.cache_dir / f"{key}.pdf"
+        try:
+            _link_or_copy(cached, dest)
+        except FileNotFoundError:
+            return False
+        (self.cache_dir / f"{key}.used").touch()
+        return True
+
+    def store(self, key: str, pdf_file: str):
+        cached = self.cache_dir / f"{key}.pdf"
+        tmp = cached.with_name(f"{cached.name}.{threading.get_ident()}.tmp")
+        # Linked, not copied: the converted PDF is a temporary file that's
+        # never written again.
+        _link_or_copy(pdf_file, tmp)
+        os.replace(tmp, cached)
+        (self.cache_dir / f"{key}.used").touch()
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob("*.pdf"):
+                used = path.with_suffix(".used")
+                try:
+                    size = path.stat().st_size
+                    mtime = used.stat().st_mtime if used.exists() else 0
+                except FileNotFoundError:
+                    continue
+                entries.append((mtime, size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                path.with_suffix(".used").unlink(missing_ok=True)
+                total -= size
+
+
+class ArtifactStore:
+    """
+    Finished reports addressed by a hash of their name and content, each
+    remembering the download record it was uploaded as, so an identical
+    report reuses that record instead of adding another copy. Bounded by
+    total size and age. Objects are linked to downloads, so recency is the
+    mtime of the "<key>.download" record, never the object's.
+    """
+
+    def __init__(self, store_dir: Path, max_bytes: int, max_age: float):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        store_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, path: Path) -> str:
+        digest = hashlib.sha256(path.name.encode() + b"\0")
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def download_id(self, key: str, location: str | None = None):
+        """
+        The download id stored for key, or None. With location (the record's
+        file), also None unless that file still holds the stored content.
+        """
+        obj = self.store_dir / key
+        ref_path = self.store_dir / f"{key}.download"
+        try:
+            ref = ref_path.read_text().split()
+            download_id = int(ref[0])
+            # Entries from before the flag was recorded count as linked, so
+            # they're only trusted when they still are.
+            linked = ref[1:] != ["0"]
+            obj.stat()
+            # mtime is the recency used for eviction.
+            ref_path.touch()
+        except (OSError, ValueError, IndexError):
+            return None
+        if location is not None and not _same_content(obj, location, linked):
+            return None
+        return download_id
+
+    def add(self, key: str, path: Path, location: str, download_id: int):
+        """
+        Keep path as the object for key and make the download's file at
+        location a link to it, so the content is on disk once.
+        """
+        obj = self.store_dir / key
+        tmp = obj.with_name(f"{key}.{threading.get_ident()}.tmp")
+        _link_or_copy(path, tmp)
+        os.replace(tmp, obj)
+        try:
+            link = f"{location}.{threading.get_ident()}.tmp"
+            os.link(obj, link)
+            os.replace(link, location)
+            linked = True
+        except OSError:
+            # Another filesystem: the download keeps its own copy.
+            linked = False
+        ref = self.store_dir / f"{key}.download"
+        ref_tmp = ref.with_name(f"{ref.name}.{threading.get_ident()}.tmp")
+        ref_tmp.write_text(f"{download_id} {int(linked)}")
+        os.replace(ref_tmp, ref)
+        self.evict()
+
+    def forget(self, key: str):
+        (self.store_dir / f"{key}.download").unlink(missing_ok=True)
+        (self.store_dir / key).unlink(missing_ok=True)
+
+    def evict(self):
+        with self._lock:
+            expired = time.time() - self.max_age
+            entries = []
+            for ref in self.store_dir.glob("*.download"):
+                obj = ref.with_suffix("")
+                try:
+                    size = obj.stat().st_size
+                    mtime = ref.stat().st_mtime
+                except FileNotFoundError:
+                    ref.unlink(missing_ok=True)
+                    continue
+                entries.append((mtime, size, obj.name))
+
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, key in sorted(entries):
+                if total <= self.max_bytes and mtime >= expired:
+                    break
+                self.forget(key)
+                total -= size
+
+
+def _same_content(obj, location, linked):
+    try:
+        if os.path.samefile(obj, location):
+            return True
+        # A linked entry that no longer is points at some other file, even
+        # one of the same size (a reused download id). Only entries that were
+        # never linked (another filesystem) fall back to the size.
+        if linked:
+            return False
+        return os.path.getsize(obj) == os.path.getsize(location)
+    except OSError:
+        return False
+
+
+def _link_or_copy(src, dest):
+    # A hard link costs no I/O; fall back to copying across filesystems.
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
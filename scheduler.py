@@ -0,0 +1,73 @@
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class ReportScheduler:
+    """
+    Collects reports marked dirty by server events and regenerates each one
+    once per debounce window, with at most max_running in flight.
+
+    The window opens at the first mark instead of restarting on every one, so
+    a busy server still gets fresh reports every debounce seconds.
+    """
+
+    def __init__(self, submit, debounce: float, max_running: int = 1):
+        # submit(report) starts a regeneration and returns its future.
+        self.submit = submit
+        self.debounce = debounce
+        self.max_running = max(max_running, 1)
+        self.dirty = set()
+        self.running = set()
+        self._timer = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def mark(self, *reports):
+        with self._lock:
+            if self._stopped:
+                return
+            self.dirty.update(reports)
+            self._arm()
+
+    def _arm(self):
+        # Called with the lock held.
+        if self._timer is None and self.dirty and not self._stopped:
+            self._timer = threading.Timer(self.debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            if self._stopped:
+                return
+            # A report still regenerating stays dirty until it's done, as do
+            # those past the limit; finishing re-arms the timer for them.
+            ready = sorted(self.dirty - self.running)
+            ready = ready[: max(self.max_running - len(self.running), 0)]
+            self.dirty.difference_update(ready)
+            self.running.update(ready)
+
+        for report in ready:
+            try:
+                job = self.submit(report)
+            except Exception:
+                log.exception(f"Scheduled {report} report failed to start")
+                self._finished(report)
+                continue
+            job.add_done_callback(lambda _job, r=report: self._finished(r))
+
+    def _finished(self, report):
+        with self._lock:
+            self.running.discard(report)
+            self._arm()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self.dirty.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
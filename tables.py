@@ -0,0 +1,52 @@
+from html import escape
+
+
+def html_row(cells) -> str:
+    """
+    One escaped table row on one line. Newlines inside a cell become a
+    character reference, which HTML renders the same, so cached fragments
+    and chunked conversion can split a table body by line.
+    """
+    return "<tr>" + "".join(f"<td>{_cell(cell)}</td>" for cell in cells) + "</tr>\n"
+
+
+def html_rows(rows):
+    """
+    Yield HTML rows as the rows iterator produces them; nothing is buffered.
+    """
+    for row in rows:
+        yield html_row(row)
+
+
+def html_table(header, rows_html):
+    """
+    Yield a whole table around already rendered rows.
+    """
+    yield "<table>\n<tbody>\n"
+    yield html_row(header)
+    yield from rows_html
+    yield "</tbody>\n</table>"
+
+
+class HtmlTable:
+    """
+    A table template variable. Templates loop over it to stream the table
+    out piece by piece, printing it renders it in one go, and chunked PDF
+    conversion batches its rows. The rows are consumed by the first pass.
+    """
+
+    def __init__(self, header, rows_html):
+        self.header = header
+        self.rows = rows_html
+
+    def __iter__(self):
+        return html_table(self.header, self.rows)
+
+    def __str__(self):
+        return "".join(self)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    return escape(str(value)).replace("\n", "&#10;")